@@ -188,6 +188,7 @@ class ConfigTestGenerator(test_data_generation.TestGenerator):
 
     def __init__(self, settings):
         # pylint: disable=no-member
+        super().__init__(settings)
         config_members = dict(inspect.getmembers(config))
         if 'MbedTLSConfig' in config_members:
             self.mbedtls_config = config.MbedTLSConfig()
@@ -202,7 +203,14 @@ class ConfigTestGenerator(test_data_generation.TestGenerator):
             self.psa_config = config.TFPSACryptoConfig()
             self.targets['test_suite_config.psa_boolean'] = \
                 lambda: enumerate_boolean_setting_cases(self.psa_config)
-        super().__init__(settings)
+
+    def dependency_files(self, name: str) -> List[str]:
+        files = super().dependency_files(name) + [config.__file__]
+        for cfg in (getattr(self, 'mbedtls_config', None),
+                    getattr(self, 'psa_config', None)):
+            if cfg is not None:
+                files += [configfile.filename for configfile in cfg.configfiles]
+        return files
 
 
 if __name__ == '__main__':
@@ -9,6 +9,7 @@ generate only the specified files.
 # SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
 
 import enum
+import functools
 import re
 import sys
 from typing import Callable, Dict, Iterable, Iterator, List, Optional
@@ -23,6 +24,13 @@ from mbedtls_framework import test_case
 from mbedtls_framework import test_data_generation
 
 
+@functools.lru_cache(maxsize=crypto_knowledge.KEY_MATERIAL_CACHE_SIZE)
+def key_material_hex_string(key_type: str, bits: int) -> str:
+    """Return key material for the given key type and size as a .data argument.
+
+    The result is cached, since the same key is used in many test cases.
+    """
+    return test_case.hex_string(crypto_knowledge.key_material(key_type, bits))
 
 def test_case_for_key_type_not_supported(
         verb: str, key_type: str, bits: int,
@@ -85,7 +93,7 @@ class KeyTypeNotSupported:
             yield test_case_for_key_type_not_supported(
                 'import', kt.expression, bits,
                 not_supported_mechanism,
-                test_case.hex_string(kt.key_material(bits)),
+                key_material_hex_string(kt.expression, bits),
                 param_descr=param_descr,
             )
             # Don't generate not-supported test cases for key generation of
@@ -211,11 +219,8 @@ class OpFail:
 
     def __init__(self, info: psa_information.Information) -> None:
         self.constructors = info.constructors
-        key_type_expressions = self.constructors.generate_expressions(
-            sorted(self.constructors.key_types)
-        )
-        self.key_types = [crypto_knowledge.KeyType(kt_expr)
-                          for kt_expr in key_type_expressions]
+        self.compatibility = info.compatibility_matrix()
+        self.key_types = self.compatibility.key_types
 
     def make_test_case(
             self,
@@ -253,13 +258,12 @@ class OpFail:
         arguments = [] # type: List[str]
         if kt:
             bits = kt.sizes_to_test()[0]
-            if pretty_alg == "XTS" and kt.can_do(alg):
+            if pretty_alg == "XTS" and self.compatibility.key_can_do(kt, alg):
                 # XTS mode uses double-size keys for the underlying block cipher
                 bits = bits * 2
             tc.set_key_bits(bits)
             tc.set_key_pair_usage(['IMPORT'])
-            key_material = kt.key_material(bits)
-            arguments += [key_type, test_case.hex_string(key_material)]
+            arguments += [key_type, key_material_hex_string(key_type, bits)]
         arguments.append(alg.expression)
         if category.is_asymmetric():
             arguments.append('1' if reason == self.Reason.PUBLIC else '0')
@@ -293,7 +297,7 @@ class OpFail:
             category: crypto_knowledge.AlgorithmCategory,
     ) -> Iterator[test_case.TestCase]:
         """Generate failure test cases for keyless operations with the specified algorithm."""
-        if alg.can_do(category):
+        if self.compatibility.alg_can_do(alg, category):
             # Compatible operation, unsupported algorithm
             for dep in psa_information.automatic_dependencies(alg.base_expression):
                 yield self.make_test_case(alg, category,
@@ -309,9 +313,10 @@ class OpFail:
             category: crypto_knowledge.AlgorithmCategory,
     ) -> Iterator[test_case.TestCase]:
         """Generate failure test cases for one-key operations with the specified algorithm."""
+        alg_is_compatible = self.compatibility.alg_can_do(alg, category)
         for kt in self.key_types:
-            key_is_compatible = kt.can_do(alg)
-            if key_is_compatible and alg.can_do(category):
+            key_is_compatible = self.compatibility.key_can_do(kt, alg)
+            if key_is_compatible and alg_is_compatible:
                 # Compatible key and operation, unsupported algorithm
                 for dep in psa_information.automatic_dependencies(alg.base_expression):
                     yield self.make_test_case(alg, category,
@@ -327,7 +332,7 @@ class OpFail:
                 yield self.make_test_case(alg, category,
                                           self.Reason.INVALID,
                                           kt=kt)
-            elif alg.can_do(category):
+            elif alg_is_compatible:
                 # Incompatible key, compatible operation, supported algorithm
                 yield self.make_test_case(alg, category,
                                           self.Reason.INCOMPATIBLE,
@@ -352,10 +357,7 @@ class OpFail:
 
     def all_test_cases(self) -> Iterator[test_case.TestCase]:
         """Generate all test cases for operations that must fail."""
-        algorithm_constructors = sorted(self.constructors.algorithms)
-        algorithms = [crypto_knowledge.Algorithm(alg)
-                      for alg in self.constructors.generate_expressions(
-                          algorithm_constructors)]
+        algorithms = self.compatibility.algorithms
         supported_categories = set()
         for alg in algorithms:
             supported_categories.add(alg.category)
@@ -437,6 +439,7 @@ class StorageFormat:
           generate backward compatibility test cases which inject a key
           representation and check that it can be read and used.
         """
+        self.info = info
         self.constructors = info.constructors #type: macro_collector.PSAMacroEnumerator
         self.version = version #type: int
         self.forward = forward #type: bool
@@ -482,7 +485,8 @@ class StorageFormat:
             return False
         return True
 
-    def make_test_case(self, key: StorageTestData) -> test_case.TestCase:
+    def make_test_case(self, key: StorageTestData,
+                       key_hex: Optional[str] = None) -> test_case.TestCase:
         """Construct a storage format test case for the given key.
 
         If ``forward`` is true, generate a forward compatibility test case:
@@ -490,7 +494,11 @@ class StorageFormat:
         Otherwise generate a backward compatibility test case: inject the
         key representation into storage and validate that it can be read
         correctly.
+
+        `key_hex` is ``key.hex()``, if the caller already has it.
         """
+        if key_hex is None:
+            key_hex = key.hex()
         verb = 'save' if self.forward else 'read'
         tc = psa_test_case.TestCase()
         tc.set_description(verb + ' ' + key.description)
@@ -512,7 +520,7 @@ class StorageFormat:
                           key.expected_usage.string,
                           key.alg.string, key.alg2.string,
                           '"' + key.material.hex() + '"',
-                          '"' + key.hex() + '"',
+                          '"' + key_hex + '"',
                           *extra_arguments])
         return tc
 
@@ -639,7 +647,8 @@ class StorageFormat:
             all_algorithms: List[crypto_knowledge.Algorithm],
     ) -> Iterator[StorageTestData]:
         """Generate test keys for the given key type."""
-        kt = crypto_knowledge.KeyType(key_type)
+        kt = crypto_knowledge.KeyType.intern(key_type)
+        compatibility = self.info.compatibility_matrix()
         for bits in kt.sizes_to_test():
             # Test a non-exercisable key, as well as exercisable keys for
             # each compatible algorithm.
@@ -647,7 +656,7 @@ class StorageFormat:
             # or unsupported algorithm.
             yield self.key_for_type_and_alg(kt, bits)
             compatible_algorithms = [alg for alg in all_algorithms
-                                     if kt.can_do(alg)]
+                                     if compatibility.key_can_do(kt, alg)]
             for alg in compatible_algorithms:
                 if alg.expression == 'PSA_ALG_XTS':
                     # XTS mode uses double-size keys for the underlying block cipher
@@ -660,13 +669,10 @@ class StorageFormat:
 
     def all_keys_for_types(self) -> Iterator[StorageTestData]:
         """Generate test keys covering key types and their representations."""
-        key_types = sorted(self.constructors.key_types)
-        all_algorithms = [crypto_knowledge.Algorithm(alg)
-                          for alg in self.constructors.generate_expressions(
-                              sorted(self.constructors.algorithms)
-                          )]
-        for key_type in self.constructors.generate_expressions(key_types):
-            yield from self.keys_for_type(key_type, all_algorithms)
+        compatibility = self.info.compatibility_matrix()
+        for kt in compatibility.key_types:
+            yield from self.keys_for_type(kt.expression,
+                                          compatibility.algorithms)
 
     def keys_for_algorithm(self, alg: str) -> Iterator[StorageTestData]:
         """Generate test keys for the encoding of the specified algorithm."""
@@ -711,13 +717,15 @@ class StorageFormat:
         # one go, which is a significant performance gain as the information
         # includes numerical values obtained by compiling a C program.
         all_keys = list(self.generate_all_keys())
-        for key in all_keys:
-            if key.location_value() != 0:
-                # Skip keys with a non-default location, because they
-                # require a driver and we currently have no mechanism to
-                # determine whether a driver is available.
-                continue
-            yield self.make_test_case(key)
+        # Evaluate the expressions that other storage targets are likely to
+        # need in the same go, so that they don't need to compile again.
+        self.info.prefetch_storage_values()
+        # Skip keys with a non-default location, because they
+        # require a driver and we currently have no mechanism to
+        # determine whether a driver is available.
+        keys = [key for key in all_keys if key.location_value() == 0]
+        for key, key_hex in zip(keys, StorageTestData.hex_of_all(keys)):
+            yield self.make_test_case(key, key_hex)
 
 class StorageFormatForward(StorageFormat):
     """Storage format stability test cases for forward compatibility."""
@@ -783,7 +791,7 @@ class StorageFormatV0(StorageFormat):
         exclusive_keywords = {
             'EDWARDS': 'ECC'
         }
-        key_types = set(self.constructors.generate_expressions(self.constructors.key_types))
+        key_types = set(self.constructors.expressions_for('key_type'))
         algorithms = set(self.constructors.generate_expressions(self.constructors.sign_algorithms))
         alg_with_keys = {} #type: Dict[str, List[str]]
         translation_table = str.maketrans('(', '_', ')')
@@ -828,7 +836,7 @@ class StorageFormatV0(StorageFormat):
             for alg in sorted(alg_with_keys):
                 for key_type in sorted(alg_with_keys[alg]):
                     # The key types must be filtered to fit the specific usage flag.
-                    kt = crypto_knowledge.KeyType(key_type)
+                    kt = crypto_knowledge.KeyType.intern(key_type)
                     if kt.is_public() and '_SIGN_' in usage:
                         # Can't sign with a public key
                         continue
@@ -860,10 +868,26 @@ class PSATestGenerator(test_data_generation.TestGenerator):
 
     def __init__(self, options):
         super().__init__(options)
-        self.info = psa_information.Information()
+        self.info = psa_information.shared_information()
+
+    def dependency_files(self, name: str) -> List[str]:
+        headers, test_suites = self.info.interface_files()
+        return (super().dependency_files(name) + headers + test_suites +
+                psa_test_case.implemented_dependencies_files())
+
+    def target_test_cases(self, name: str) -> Iterable[test_case.TestCase]:
+        return self.targets[name](self.info)
 
     def generate_target(self, name: str, *target_args) -> None:
-        super().generate_target(name, self.info)
+        compile_count = psa_storage.Expr.compile_count
+        super().generate_target(name, *target_args)
+        # Evaluating expressions is the slowest part of generating the
+        # storage format test cases. Report targets that do it more than
+        # once, since this can usually be avoided with prefetching.
+        compilations = psa_storage.Expr.compile_count - compile_count
+        if compilations > 1:
+            sys.stderr.write(f'{name}: evaluated PSA expressions in '
+                             f'{compilations} separate compilations\n')
 
 
 if __name__ == '__main__':
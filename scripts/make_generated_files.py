@@ -11,12 +11,15 @@ from pathlib import Path
 
 from mbedtls_framework import build_tree
 from mbedtls_framework import generated_files
-from mbedtls_framework.generated_files import GenerationScript, get_generation_script_files
+from mbedtls_framework.generated_files import GenerationScript
+
+# When the list of files is None, it is obtained by running the script
+# with --list, only when needed and in parallel with other scripts.
 
 COMMON_GENERATION_SCRIPTS = [
     GenerationScript(
         Path("scripts/generate_config_checks.py"),
-        get_generation_script_files("scripts/generate_config_checks.py"),
+        None,
         output_dir_option="",
         optional=True)
 ]
@@ -41,22 +44,22 @@ if build_tree.looks_like_tf_psa_crypto_root("."):
         ),
         GenerationScript(
             Path("framework/scripts/generate_bignum_tests.py"),
-            get_generation_script_files("framework/scripts/generate_bignum_tests.py"),
+            None,
             "--directory", None
         ),
         GenerationScript(
             Path("framework/scripts/generate_config_tests.py"),
-            get_generation_script_files("framework/scripts/generate_config_tests.py"),
+            None,
             "--directory", None
         ),
         GenerationScript(
             Path("framework/scripts/generate_ecp_tests.py"),
-            get_generation_script_files("framework/scripts/generate_ecp_tests.py"),
+            None,
             "--directory", None
         ),
         GenerationScript(
             Path("framework/scripts/generate_psa_tests.py"),
-            get_generation_script_files("framework/scripts/generate_psa_tests.py"),
+            None,
             "--directory", None
         ),
     ]
@@ -100,7 +103,7 @@ if build_tree.looks_like_mbedtls_root(".") and not build_tree.is_mbedtls_3_6():
         ),
         GenerationScript(
             Path("framework/scripts/generate_config_tests.py"),
-            get_generation_script_files("framework/scripts/generate_config_tests.py"),
+            None,
             "--directory", None
         ),
         GenerationScript(
@@ -119,7 +122,7 @@ if build_tree.looks_like_mbedtls_root(".") and not build_tree.is_mbedtls_3_6():
         MBEDTLS_GENERATION_SCRIPTS.append(
             GenerationScript(
                 Path("scripts/generate_visualc_files.pl"),
-                get_generation_script_files("scripts/generate_visualc_files.pl"),
+                None,
                 "--directory", None))
 
 def main() -> int:
@@ -134,6 +137,14 @@ def main() -> int:
         raise Exception("No support for Mbed TLS 3.6")
     generation_scripts += COMMON_GENERATION_SCRIPTS
 
+    # The Visual Studio project files list the source files, including
+    # generated ones, so they must be generated last.
+    for generation_script in generation_scripts:
+        if generation_script.script == Path("scripts/generate_visualc_files.pl"):
+            generation_script.depends_on = [
+                other.script for other in generation_scripts
+                if other is not generation_script]
+
     return generated_files.main(generation_scripts)
 
 if __name__ == "__main__":
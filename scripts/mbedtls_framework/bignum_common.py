@@ -5,9 +5,9 @@
 
 from abc import abstractmethod
 import enum
-from typing import Iterator, List, Tuple, TypeVar, Any
-from copy import deepcopy
-from itertools import chain
+import functools
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypeVar
 from math import ceil
 
 from . import test_case
@@ -33,8 +33,10 @@ def invmod(a: int, n: int) -> int:
 def invmod_positive(a: int, n: int) -> int:
     """Return a non-negative inverse of a to modulo n.
 
-    Equivalent to pow(a, -1, n) in Python 3.8+.
+    Equivalent to pow(a, -1, n) in Python 3.8+, which is used when available.
     """
+    if sys.version_info >= (3, 8):
+        return pow(a, -1, n)
     inv = invmod(a, n)
     return inv if inv >= 0 else inv + n
 
@@ -64,6 +66,32 @@ def limbs_mpi(val: int, bits_in_limb: int) -> int:
     bit_length = max(val.bit_length(), 1)
     return (bit_length + bits_in_limb - 1) // bits_in_limb
 
+@functools.lru_cache(maxsize=None)
+def montgomery_r(n: int, bits_in_limb: int) -> Tuple[int, int]:
+    """Return the Montgomery constants R and R^2 for the modulus n.
+
+    The result is cached, since test generators build many objects with
+    the same modulus.
+    """
+    r = bound_mpi_limbs(limbs_mpi(n, bits_in_limb), bits_in_limb)
+    return r, r * r
+
+@functools.lru_cache(maxsize=None)
+def _inverse_power_of_two(n: int, bits: int) -> int:
+    return invmod_positive(1 << bits, n)
+
+def montgomery_r_inv(n: int, bits_in_limb: int,
+                     limbs: Optional[int] = None) -> int:
+    """Return the inverse of the Montgomery constant R modulo n.
+
+    R is the first number exceeding `limbs` limbs, which defaults to the
+    number of limbs of n. The result is non-negative, and cached (see
+    `montgomery_r()`).
+    """
+    if limbs is None:
+        limbs = limbs_mpi(n, bits_in_limb)
+    return _inverse_power_of_two(n, bits_in_limb * limbs)
+
 def combination_pairs(values: List[T]) -> List[Tuple[T, T]]:
     """Return all pair combinations from input values."""
     return [(x, y) for x in values for y in values]
@@ -102,6 +130,32 @@ def zfill_match(reference: str, target: str) -> str:
     target_len = lr if lt < lr else lt
     return "{:x}".format(int(target, 16)).zfill(target_len)
 
+class Candidate:
+    """The inputs of a test object that may be created.
+
+    Test case generation enumerates many combinations of inputs, many of
+    which are invalid. Candidates are much cheaper than test objects, so
+    the inputs are filtered first, and only the test objects for valid
+    inputs are created. This is only possible when validity only depends
+    on the numerical values of the inputs (see `OperationCommon.is_valid_input()`).
+    Otherwise `values` is None, and the test object is created to call
+    its `is_valid` property.
+    """
+    #pylint: disable=too-few-public-methods
+    __slots__ = ('index', 'args', 'values')
+
+    def __init__(self, index: int, args: Tuple[Any, ...],
+                 values: Optional[Tuple[int, ...]]) -> None:
+        # The index of the candidate in the output of
+        # OperationCommon.candidates(), including invalid ones.
+        self.index = index
+        # The arguments of the constructor, other than bits_in_limb.
+        self.args = args
+        # The numerical values of the inputs, if known without creating
+        # a test object (see OperationCommon.is_valid_input()).
+        self.values = values
+
+
 class OperationCommon(test_data_generation.BaseTest):
     """Common features for bignum binary operations.
 
@@ -123,6 +177,10 @@ class OperationCommon(test_data_generation.BaseTest):
             test cases are generated for all architectures.
         arity: the number of operands for the operation. Currently supported
             values are 1 and 2.
+        shardable: Boolean to select if the test cases can be generated
+            separately for each limb size (see `generation_shards()`). Set
+            this to False in subclasses that override
+            `generate_function_tests()`.
     """
     symbol = ""
     input_values = INPUTS_DEFAULT # type: List[str]
@@ -135,6 +193,7 @@ class OperationCommon(test_data_generation.BaseTest):
     arities = [1, 2]
     arity = 2
     suffix = False   # for arity = 1, symbol can be prefix (default) or suffix
+    shardable = True
 
     def __init__(self, val_a: str, val_b: str = "0", bits_in_limb: int = 32) -> None:
         self.val_a = val_a
@@ -143,12 +202,16 @@ class OperationCommon(test_data_generation.BaseTest):
         # provides earlier/more robust input validation.
         self.int_a = hex_to_int(val_a)
         self.int_b = hex_to_int(val_b)
-        self.dependencies = deepcopy(self.dependencies)
+        # The dependencies are strings, so a shallow copy is enough.
+        self.dependencies = list(self.dependencies)
         if bits_in_limb not in self.limb_sizes:
             raise ValueError("Invalid number of bits in limb!")
         if self.input_style == "arch_split":
             self.dependencies.append("MBEDTLS_HAVE_INT{:d}".format(bits_in_limb))
         self.bits_in_limb = bits_in_limb
+        # Formatting each argument and result needs the number of hex digits,
+        # so compute it once, on first use (see `hex_digits`).
+        self._hex_digits = None #type: Optional[int]
 
     @property
     def boundary(self) -> int:
@@ -168,7 +231,9 @@ class OperationCommon(test_data_generation.BaseTest):
 
     @property
     def hex_digits(self) -> int:
-        return hex_digits_for_limb(self.limbs, self.bits_in_limb)
+        if self._hex_digits is None:
+            self._hex_digits = hex_digits_for_limb(self.limbs, self.bits_in_limb)
+        return self._hex_digits
 
     def format_arg(self, val: str) -> str:
         if self.input_style not in self.input_styles:
@@ -217,9 +282,31 @@ class OperationCommon(test_data_generation.BaseTest):
                 )
         return super().description()
 
+    def value_ints(self) -> Tuple[int, ...]:
+        """The numerical values of the inputs, as in `value_arguments()`."""
+        return (self.int_a, self.int_b)
+
+    @classmethod
+    def is_valid_input(cls, values: Tuple[int, ...],
+                       bits_in_limb: Optional[int]) -> bool:
+        """Whether the given inputs make a valid test case.
+
+        `values` contains the numerical values of the inputs (see
+        `value_ints()`). `bits_in_limb` is None unless the input style
+        is ``"arch_split"``.
+
+        This is used to filter out invalid inputs before creating
+        test objects. Override this rather than `is_valid` if validity
+        only depends on the numerical inputs.
+        """
+        #pylint: disable=unused-argument
+        return True
+
     @property
     def is_valid(self) -> bool:
-        return True
+        bits_in_limb = (self.bits_in_limb
+                        if self.input_style == "arch_split" else None)
+        return self.is_valid_input(self.value_ints(), bits_in_limb)
 
     @abstractmethod
     def result(self) -> List[str]:
@@ -252,28 +339,131 @@ class OperationCommon(test_data_generation.BaseTest):
             raise ValueError("Unsupported number of operands!")
 
     @classmethod
-    def generate_function_tests(cls) -> Iterator[test_case.TestCase]:
+    def value_arguments(cls) -> Iterator[Tuple[str, ...]]:
+        """Generate the inputs for the systematic test cases.
+
+        Each element is a tuple of arguments for the constructor, other
+        than `bits_in_limb`.
+        """
+        yield from cls.get_value_pairs()
+
+    @classmethod
+    def special_arguments(cls) -> Iterator[Tuple[Any, ...]]:
+        """Generate the constructor arguments for the specific test cases."""
+        yield from (tuple(args) for args in cls.input_cases)
+
+    @classmethod
+    def shard_limb_sizes(cls) -> List[Optional[int]]:
+        """The limb sizes that test objects are created for.
+
+        None stands for the default limb size, when the test data does not
+        depend on the limb size.
+        """
+        if cls.input_style == "arch_split":
+            return list(cls.limb_sizes)
+        return [None]
+
+    @classmethod
+    def generation_shards(cls) -> List[Optional[int]]:
+        """Shard the test case generation by limb size, if `shardable`."""
+        if not cls.shardable:
+            return []
+        return cls.shard_limb_sizes()
+
+    @classmethod
+    def _can_prefilter(cls) -> bool:
+        """Whether validity can be determined before creating a test object.
+
+        This is the case unless a subclass overrides `is_valid`, or
+        transforms its inputs in the constructor.
+        """
+        return (cls.is_valid is OperationCommon.is_valid and
+                cls.__init__ in (OperationCommon.__init__, #type: ignore
+                                 ModOperationCommon.__init__))
+
+    @classmethod
+    def candidates(cls) -> Iterator[Candidate]:
+        """Enumerate the constructor arguments of the test objects.
+
+        The candidates are in the order of generate_function_tests(),
+        including the ones that turn out to be invalid. Each candidate
+        stands for one test object per limb size in `shard_limb_sizes()`.
+        """
+        prefilter = cls._can_prefilter()
+        ints = {} #type: Dict[str, int]
+        index = 0
+        for args in cls.value_arguments():
+            values = None
+            if prefilter:
+                for val in args:
+                    if val not in ints:
+                        ints[val] = hex_to_int(val)
+                values = tuple(ints[val] for val in args)
+            yield Candidate(index, args, values)
+            index += 1
+        for args in cls.special_arguments():
+            yield Candidate(index, args, None)
+            index += 1
+
+    @classmethod
+    def _check_parameters(cls) -> None:
         if cls.input_style not in cls.input_styles:
             raise ValueError("Unknown input style!")
         if cls.arity not in cls.arities:
             raise ValueError("Unsupported number of operands!")
-        if cls.input_style == "arch_split":
-            test_objects = (cls(a, b, bits_in_limb=bil)
-                            for a, b in cls.get_value_pairs()
-                            for bil in cls.limb_sizes)
-            special_cases = (cls(*args, bits_in_limb=bil) # type: ignore
-                             for args in cls.input_cases
-                             for bil in cls.limb_sizes)
-        else:
-            test_objects = (cls(a, b)
-                            for a, b in cls.get_value_pairs())
-            special_cases = (cls(*args) for args in cls.input_cases)
-        yield from (valid_test_object.create_test_case()
-                    for valid_test_object in filter(
-                        lambda test_object: test_object.is_valid,
-                        chain(test_objects, special_cases)
-                        )
-                    )
+
+    @classmethod
+    def generate_shard(cls, shard: Optional[int],
+                       base_count: int) -> Tuple[List[Tuple[int, test_case.TestCase]],
+                                                 int]:
+        """Generate the test cases for the limb size `shard`.
+
+        The test objects for all limb sizes are created in an interleaved
+        order, and each one increments `count`. So set `count` before
+        creating each test object, to obtain the same numbering as if the
+        test objects for all limb sizes had been created.
+        """
+        cls._check_parameters()
+        limb_sizes = cls.shard_limb_sizes()
+        stride = len(limb_sizes)
+        offset = limb_sizes.index(shard)
+        results = []
+        size = 0
+        for candidate in cls.candidates():
+            size += stride
+            if candidate.values is not None and \
+               not cls.is_valid_input(candidate.values, shard):
+                continue
+            position = candidate.index * stride + offset
+            cls.count = base_count + position
+            test_object = cls._make_test_object(candidate.args, shard)
+            if test_object.is_valid:
+                results.append((position, test_object.create_test_case()))
+        return results, size
+
+    @classmethod
+    def _make_test_object(cls, args: Tuple[Any, ...],
+                          bits_in_limb: Optional[int]) -> 'OperationCommon':
+        if bits_in_limb is None:
+            return cls(*args)
+        return cls(*args, bits_in_limb=bits_in_limb) # type: ignore
+
+    @classmethod
+    def generate_function_tests(cls) -> Iterator[test_case.TestCase]:
+        cls._check_parameters()
+        limb_sizes = cls.shard_limb_sizes()
+        for candidate in cls.candidates():
+            for bits_in_limb in limb_sizes:
+                if candidate.values is not None and \
+                   not cls.is_valid_input(candidate.values, bits_in_limb):
+                    # Number the test cases as if the test object had
+                    # been created.
+                    cls.count += 1
+                    continue
+                test_object = cls._make_test_object(candidate.args,
+                                                    bits_in_limb)
+                if test_object.is_valid:
+                    yield test_object.create_test_case()
 
 
 class ModulusRepresentation(enum.Enum):
@@ -349,24 +539,28 @@ class ModOperationCommon(OperationCommon):
 
     @property
     def r(self) -> int: # pylint: disable=invalid-name
-        l = limbs_mpi(self.int_n, self.bits_in_limb)
-        return bound_mpi_limbs(l, self.bits_in_limb)
+        return montgomery_r(self.int_n, self.bits_in_limb)[0]
 
     @property
     def r_inv(self) -> int:
-        return invmod(self.r, self.int_n)
+        return montgomery_r_inv(self.int_n, self.bits_in_limb)
 
     @property
     def r2(self) -> int: # pylint: disable=invalid-name
-        return pow(self.r, 2)
+        return montgomery_r(self.int_n, self.bits_in_limb)[1]
 
-    @property
-    def is_valid(self) -> bool:
-        if self.int_a >= self.int_n:
+    def value_ints(self) -> Tuple[int, ...]:
+        return (self.int_n, self.int_a, self.int_b)
+
+    @classmethod
+    def is_valid_input(cls, values: Tuple[int, ...],
+                       bits_in_limb: Optional[int]) -> bool:
+        int_n, int_a, int_b = values
+        if int_a >= int_n:
             return False
-        if self.disallow_zero_a and self.int_a == 0:
+        if cls.disallow_zero_a and int_a == 0:
             return False
-        if self.arity == 2 and self.int_b >= self.int_n:
+        if cls.arity == 2 and int_b >= int_n:
             return False
         return True
 
@@ -391,26 +585,11 @@ class ModOperationCommon(OperationCommon):
             raise ValueError("Unsupported number of operands!")
 
     @classmethod
-    def generate_function_tests(cls) -> Iterator[test_case.TestCase]:
-        if cls.input_style not in cls.input_styles:
-            raise ValueError("Unknown input style!")
-        if cls.arity not in cls.arities:
-            raise ValueError("Unsupported number of operands!")
-        if cls.input_style == "arch_split":
-            test_objects = (cls(n, a, b, bits_in_limb=bil)
-                            for n in cls.moduli
-                            for a, b in cls.get_value_pairs()
-                            for bil in cls.limb_sizes)
-            special_cases = (cls(*args, bits_in_limb=bil)
-                             for args in cls.input_cases_args()
-                             for bil in cls.limb_sizes)
-        else:
-            test_objects = (cls(n, a, b)
-                            for n in cls.moduli
-                            for a, b in cls.get_value_pairs())
-            special_cases = (cls(*args) for args in cls.input_cases_args())
-        yield from (valid_test_object.create_test_case()
-                    for valid_test_object in filter(
-                        lambda test_object: test_object.is_valid,
-                        chain(test_objects, special_cases)
-                        ))
+    def value_arguments(cls) -> Iterator[Tuple[str, ...]]:
+        yield from ((n, a, b)
+                    for n in cls.moduli
+                    for a, b in cls.get_value_pairs())
+
+    @classmethod
+    def special_arguments(cls) -> Iterator[Tuple[Any, ...]]:
+        yield from cls.input_cases_args()
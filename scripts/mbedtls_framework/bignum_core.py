@@ -6,7 +6,7 @@
 import math
 import random
 
-from typing import Dict, Iterator, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from . import test_case
 from . import test_data_generation
@@ -116,8 +116,9 @@ class BignumCoreShiftL(BignumCoreTarget, bignum_common.ModOperationCommon):
         result = result & (mx - 1)
         return [self.format_result(result)]
 
-    @property
-    def is_valid(self) -> bool:
+    @classmethod
+    def is_valid_input(cls, values: Tuple[int, ...],
+                       bits_in_limb: Optional[int]) -> bool:
         return True
 
 
@@ -208,6 +209,7 @@ class BignumCoreMLA(BignumCoreTarget, bignum_common.OperationCommon):
     count = 0
     test_function = "mpi_core_mla"
     test_name = "mbedtls_mpi_core_mla"
+    shardable = False
 
     input_values = [
         "0", "1", "fffe", "ffffffff", "100000000", "20000000000000",
@@ -653,6 +655,12 @@ class BignumCoreMontmul(BignumCoreTarget, test_data_generation.BaseTest):
         )
     ] # type: List[Tuple[str, str, str, str]]
 
+    @classmethod
+    def reset_generation_state(cls) -> None:
+        super().reset_generation_state()
+        cls.start_2_mpi4 = False
+        cls.start_2_mpi8 = False
+
     def __init__(
             self, val_a: str, val_b: str, val_n: str, case_description: str = ""
         ):
@@ -700,13 +708,11 @@ class BignumCoreMontmul(BignumCoreTarget, test_data_generation.BaseTest):
 
     def result(self) -> List[str]:
         """Get the result of the operation."""
-        r4 = bignum_common.bound_mpi_limbs(self.limbs_an4, 32)
-        i4 = bignum_common.invmod(r4, self.int_n)
+        i4 = bignum_common.montgomery_r_inv(self.int_n, 32, self.limbs_an4)
         x4 = self.int_a * self.int_b * i4
         x4 = x4 % self.int_n
 
-        r8 = bignum_common.bound_mpi_limbs(self.limbs_an8, 64)
-        i8 = bignum_common.invmod(r8, self.int_n)
+        i8 = bignum_common.montgomery_r_inv(self.int_n, 64, self.limbs_an8)
         x8 = self.int_a * self.int_b * i8
         x8 = x8 % self.int_n
         return [
@@ -844,11 +850,13 @@ class BignumCoreExpMod(BignumCoreTarget, bignum_common.ModOperationCommon):
         mont_result = self.to_montgomery(result)
         return [self.format_result(mont_result)]
 
-    @property
-    def is_valid(self) -> bool:
+    @classmethod
+    def is_valid_input(cls, values: Tuple[int, ...],
+                       bits_in_limb: Optional[int]) -> bool:
         # The base needs to be canonical, but the exponent can be larger than
         # the modulus (see for example exponent blinding)
-        return bool(self.int_a < self.int_n)
+        int_n, int_a, _int_b = values
+        return bool(int_a < int_n)
 
 
 class BignumCoreSubInt(BignumCoreTarget, bignum_common.OperationCommon):
@@ -859,10 +867,12 @@ class BignumCoreSubInt(BignumCoreTarget, bignum_common.OperationCommon):
     test_name = "mpi_core_sub_int"
     input_style = "arch_split"
 
-    @property
-    def is_valid(self) -> bool:
+    @classmethod
+    def is_valid_input(cls, values: Tuple[int, ...],
+                       bits_in_limb: Optional[int]) -> bool:
+        assert bits_in_limb is not None # guide mypy
         # This is "sub int", so b is only one limb
-        if bignum_common.limbs_mpi(self.int_b, self.bits_in_limb) > 1:
+        if bignum_common.limbs_mpi(values[1], bits_in_limb) > 1:
             return False
         return True
 
@@ -3,7 +3,7 @@
 # SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
 #
 
-from typing import Iterator, List
+from typing import Iterator, List, Optional, Tuple
 
 from . import test_case
 from . import test_data_generation
@@ -62,9 +62,11 @@ class BignumModRawFixQuasiReduction(bignum_common.ModOperationCommon,
         result = self.int_a % self.int_n
         return [self.format_result(result)]
 
-    @property
-    def is_valid(self) -> bool:
-        return bool(self.int_a < 2 * self.int_n)
+    @classmethod
+    def is_valid_input(cls, values: Tuple[int, ...],
+                       bits_in_limb: Optional[int]) -> bool:
+        int_n, int_a, _int_b = values
+        return bool(int_a < 2 * int_n)
 
 class BignumModRawMul(bignum_common.ModOperationCommon,
                       BignumModRawTarget):
@@ -128,6 +130,7 @@ class BignumModRawConvertRep(bignum_common.ModOperationCommon,
     input_style = "arch_split"
     arity = 1
     rep = bignum_common.ModulusRepresentation.INVALID
+    shardable = False
 
     def set_representation(self, r: bignum_common.ModulusRepresentation) -> None:
         self.rep = r
@@ -5,11 +5,18 @@
 # SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
 #
 
+import concurrent.futures
+import ctypes
+import io
 import os
 import platform
+import shutil
 import subprocess
 import sys
 import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from . import persistent_cache
 
 class CompileError(Exception):
     """Exception to represent an error during the compilation."""
@@ -86,6 +93,30 @@ int main(void)
 }
 ''')
 
+def host_compiler_command() -> List[str]:
+    """Return the command to run the host compiler, as a list of words."""
+    # Respect $HOSTCC if it is set
+    cc = os.getenv('HOSTCC', None)
+    if cc is None:
+        cc = os.getenv('CC', 'cc')
+    return cc.split()
+
+_compiler_is_msvc = {} #type: Dict[Tuple[str, ...], bool]
+
+def compiler_is_msvc(cmd: List[str]) -> bool:
+    """Whether the given compiler command runs MSVC.
+
+    This runs the compiler once per process for each command.
+    """
+    key = tuple(cmd)
+    if key not in _compiler_is_msvc:
+        proc = subprocess.Popen(cmd,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        _compiler_is_msvc[key] = 'Microsoft (R) C/C++' in proc.communicate()[1]
+    return _compiler_is_msvc[key]
+
 def compile_c_file(c_filename, exe_filename, include_dirs):
     """Compile a C source file with the host compiler.
 
@@ -94,17 +125,8 @@ def compile_c_file(c_filename, exe_filename, include_dirs):
     * ``include_dirs``: a list of paths to include directories to be passed
       with the -I switch.
     """
-    # Respect $HOSTCC if it is set
-    cc = os.getenv('HOSTCC', None)
-    if cc is None:
-        cc = os.getenv('CC', 'cc')
-    cmd = cc.split()
-
-    proc = subprocess.Popen(cmd,
-                            stdout=subprocess.DEVNULL,
-                            stderr=subprocess.PIPE,
-                            universal_newlines=True)
-    cc_is_msvc = 'Microsoft (R) C/C++' in proc.communicate()[1]
+    cmd = host_compiler_command()
+    cc_is_msvc = compiler_is_msvc(cmd)
 
     cmd += ['-I' + dir for dir in include_dirs]
     if cc_is_msvc:
@@ -123,6 +145,75 @@ def compile_c_file(c_filename, exe_filename, include_dirs):
     except subprocess.CalledProcessError as e:
         raise CompileError(e.stderr) from e
 
+EXECUTABLE_CACHE_KIND = 'c_build'
+"""Kind of the persistent cache entries for compiled programs."""
+
+EXECUTABLE_CACHE_MAX_SIZE = 64 * 1024 * 1024
+"""Maximum total size of the cached compiled programs, in bytes."""
+
+def cached_executable(source: str, include_dirs: List[str],
+                      suffix: Optional[str] = None) -> Optional[str]:
+    """Return the path of the cached executable built from ``source``, if any.
+
+    The cache is keyed by the source code, the compiler, the include
+    directories and the content of the headers in them.
+    ``suffix`` defaults to the suffix of executable programs.
+    """
+    key = persistent_cache.c_compilation_key(include_dirs, source)
+    if suffix is None:
+        suffix = '.exe' if platform.system() == 'Windows' else ''
+    return persistent_cache.entry_path(EXECUTABLE_CACHE_KIND, key, suffix)
+
+def save_executable(exe_name: str, cached_name: str) -> None:
+    """Copy a freshly built executable into the cache, ignoring errors."""
+    temp_name = cached_name + '.{}.tmp'.format(os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cached_name), exist_ok=True)
+        shutil.copy2(exe_name, temp_name)
+        os.replace(temp_name, cached_name)
+    except OSError:
+        remove_file_if_exists(temp_name)
+        return
+    persistent_cache.trim(EXECUTABLE_CACHE_KIND, EXECUTABLE_CACHE_MAX_SIZE)
+
+def run_c_program(source, caller, file_label, include_path, keep_c):
+    """Build and run a C program, and return its standard output.
+
+    * ``source``: the full text of the C program.
+    * Other arguments: see `get_c_expression_values`.
+
+    If a program with the same source has already been built with the
+    same compiler and headers, run the cached executable instead (see
+    the `persistent_cache` module).
+    """
+    cached_name = cached_executable(source, include_path)
+    if cached_name is not None and not keep_c:
+        try:
+            output = subprocess.check_output([cached_name])
+            persistent_cache.touch(cached_name)
+            return output
+        except OSError:
+            # Not in the cache (or removed concurrently): build it.
+            pass
+    c_name = None
+    exe_name = None
+    try:
+        c_file, c_name, exe_name = create_c_file(file_label)
+        with c_file:
+            c_file.write(source)
+        compile_c_file(c_name, exe_name, include_path)
+        if keep_c:
+            sys.stderr.write('List of {} tests kept at {}\n'
+                             .format(caller, c_name))
+        else:
+            os.remove(c_name)
+        output = subprocess.check_output([exe_name])
+        if cached_name is not None:
+            save_executable(exe_name, cached_name)
+        return output
+    finally:
+        remove_file_if_exists(exe_name)
+
 def get_c_expression_values(
         cast_to, printf_format,
         expressions,
@@ -146,31 +237,146 @@ def get_c_expression_values(
     to ``cc``. If ``CC`` looks like MSVC, use its command line syntax,
     otherwise assume the compiler supports Unix traditional ``-I`` and ``-o``.
 
+    Compiled programs are cached across runs (see `run_c_program`).
+
     Return the list of values of the ``expressions``.
     """
     if include_path is None:
         include_path = []
-    c_name = None
-    exe_name = None
-    obj_name = None
+    source = io.StringIO()
+    generate_c_file(
+        source, caller, header,
+        lambda c_file: generate_c_printf_expressions(c_file,
+                                                     cast_to, printf_format,
+                                                     expressions)
+    )
+    output = run_c_program(source.getvalue(), caller, file_label,
+                           include_path, keep_c)
+    return output.decode('ascii').strip().split('\n')
+
+
+# Types that get_c_expression_values_via_library() can read back.
+_CTYPES_FOR_C_TYPES = {
+    'int': ctypes.c_int,
+    'unsigned': ctypes.c_uint,
+    'unsigned int': ctypes.c_uint,
+    'long': ctypes.c_long,
+    'unsigned long': ctypes.c_ulong,
+    'long long': ctypes.c_longlong,
+    'unsigned long long': ctypes.c_ulonglong,
+}
+
+def _generate_c_array(c_file, header, cast_to, name, expressions):
+    """Generate a translation unit defining an array with the values of
+    ``expressions``.
+    """
+    c_file.write(header)
+    c_file.write('\nconst {} {}[] = {{\n'.format(cast_to, name))
+    for expr in expressions:
+        c_file.write('    ({}) ({}),\n'.format(cast_to, expr))
+    c_file.write('};\n')
+
+def _build_shared_library(sources, include_dirs, directory, lib_name, jobs):
+    """Compile the given sources into a shared library.
+
+    The translation units are compiled concurrently.
+    """
+    cmd = host_compiler_command()
+    includes = ['-I' + dir for dir in include_dirs]
+
+    def compile_one(index):
+        c_name = os.path.join(directory, 'values{}.c'.format(index))
+        obj_name = os.path.join(directory, 'values{}.o'.format(index))
+        with open(c_name, 'w', encoding='ascii') as c_file:
+            c_file.write(sources[index])
+        try:
+            subprocess.check_output(cmd + includes +
+                                    ['-fPIC', '-c', '-o', obj_name, c_name],
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+        except subprocess.CalledProcessError as e:
+            raise CompileError(e.stderr) from e
+        return obj_name
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        obj_names = list(executor.map(compile_one, range(len(sources))))
     try:
-        c_file, c_name, exe_name = create_c_file(file_label)
-        generate_c_file(
-            c_file, caller, header,
-            lambda c_file: generate_c_printf_expressions(c_file,
-                                                         cast_to, printf_format,
-                                                         expressions)
-        )
-        c_file.close()
+        subprocess.check_output(cmd + ['-shared', '-o', lib_name] + obj_names,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        raise CompileError(e.stderr) from e
 
-        compile_c_file(c_name, exe_name, include_path)
-        if keep_c:
-            sys.stderr.write('List of {} tests kept at {}\n'
-                             .format(caller, c_name))
+def get_c_expression_values_via_library(
+        cast_to, printf_format,
+        expressions,
+        caller=__name__, file_label='',
+        header='', include_path=None,
+        keep_c=False,
+        chunk_size=500, jobs=1,
+): # pylint: disable=too-many-arguments, too-many-locals
+    """Like `get_c_expression_values`, but build a shared library.
+
+    Compile the expressions into arrays of ``cast_to`` in a shared library,
+    with ``chunk_size`` expressions per translation unit, and compile up to
+    ``jobs`` translation units concurrently. Callers that already run
+    several of these calls in parallel should divide their budget. Then
+    load the library with ``ctypes`` and read the arrays. This is faster
+    than `get_c_expression_values` for large numbers of expressions, since
+    compilers are slow on a single huge function. The expressions must be
+    constant expressions.
+
+    The values are formatted with ``printf_format``, interpreted as
+    a Python format, so the result is the same as with
+    `get_c_expression_values`. Fall back to `get_c_expression_values`
+    if the compiler is MSVC or if ``cast_to`` is not a plain integer type.
+    """
+    if include_path is None:
+        include_path = []
+    expressions = list(expressions)
+    if not expressions:
+        return []
+    c_type = _CTYPES_FOR_C_TYPES.get(cast_to)
+    if c_type is None or compiler_is_msvc(host_compiler_command()):
+        return get_c_expression_values(cast_to, printf_format, expressions,
+                                       caller=caller, file_label=file_label,
+                                       header=header,
+                                       include_path=include_path,
+                                       keep_c=keep_c)
+    chunks = [expressions[start:start + chunk_size]
+              for start in range(0, len(expressions), chunk_size)]
+    sources = []
+    for index, chunk in enumerate(chunks):
+        source = io.StringIO()
+        source.write('/* Generated by {} */\n'.format(caller))
+        _generate_c_array(source, header, cast_to,
+                          'expression_values_{}'.format(index), chunk)
+        sources.append(source.getvalue())
+    lib_suffix = '.dll' if platform.system() == 'Windows' else '.so'
+    cached_name = cached_executable('\0'.join(sources), include_path,
+                                    lib_suffix)
+    directory = tempfile.mkdtemp(prefix='tmp-{}-'.format(file_label))
+    try:
+        if cached_name is not None and not keep_c and \
+           os.path.exists(cached_name):
+            lib_name = cached_name
+            persistent_cache.touch(lib_name)
         else:
-            os.remove(c_name)
-        output = subprocess.check_output([exe_name])
-        return output.decode('ascii').strip().split('\n')
+            lib_name = os.path.join(directory, 'values' + lib_suffix)
+            _build_shared_library(sources, include_path, directory, lib_name,
+                                  max(jobs, 1))
+            if keep_c:
+                sys.stderr.write('List of {} tests kept in {}\n'
+                                 .format(caller, directory))
+            elif cached_name is not None:
+                save_executable(lib_name, cached_name)
+        library = ctypes.CDLL(os.path.abspath(lib_name))
+        values = []
+        for index, chunk in enumerate(chunks):
+            array = (c_type * len(chunk)).in_dll(
+                library, 'expression_values_{}'.format(index))
+            values += [printf_format % value for value in array]
+        return values
     finally:
-        remove_file_if_exists(exe_name)
-        remove_file_if_exists(obj_name)
+        if not keep_c:
+            shutil.rmtree(directory, ignore_errors=True)
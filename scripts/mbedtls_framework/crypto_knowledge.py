@@ -8,6 +8,7 @@ This module is entirely based on the PSA API.
 #
 
 import enum
+import functools
 import re
 from typing import FrozenSet, Iterable, List, Optional, Tuple, Dict
 
@@ -116,6 +117,28 @@ class KeyType:
         `self.name`.
         """
 
+    _interned = {} #type: Dict[str, KeyType]
+    _interned_spellings = {} #type: Dict[Tuple[str, Optional[Tuple[str, ...]]], KeyType]
+
+    @classmethod
+    def intern(cls, name: str,
+               params: Optional[Iterable[str]] = None) -> 'KeyType':
+        """Return a shared object describing the given key type.
+
+        The arguments are the same as for the constructor. All the calls
+        for the same key type expression return the same object, so each
+        key type is only analyzed once. Callers must not modify the
+        returned object.
+        """
+        spelling = (name.strip(),
+                    None if params is None else tuple(params))
+        kt = cls._interned_spellings.get(spelling)
+        if kt is None:
+            kt = cls(name, params)
+            kt = cls._interned.setdefault(kt.expression, kt)
+            cls._interned_spellings[spelling] = kt
+        return kt
+
     def short_expression(self, level: int = 0) -> str:
         """Abbreviate the expression, keeping it human-readable.
 
@@ -192,7 +215,13 @@ class KeyType:
         psa_generate_key(&attributes, &id);
         psa_export_key(id, `material`, ...);
         ```
+
+        The result is cached: see `key_material()`.
         """
+        return key_material(self.expression, bits)
+
+    def make_key_material(self, bits: int) -> bytes:
+        """Construct the key material for `key_material()`, without caching."""
         if self.expression in ASYMMETRIC_KEY_DATA:
             if bits not in ASYMMETRIC_KEY_DATA[self.expression]:
                 raise ValueError('No key data for {}-bit {}'
@@ -269,6 +298,18 @@ class KeyType:
         return False
 
 
+KEY_MATERIAL_CACHE_SIZE = 1024
+
+@functools.lru_cache(maxsize=KEY_MATERIAL_CACHE_SIZE)
+def key_material(expression: str, bits: int) -> bytes:
+    """Return key material for the given key type and bit length.
+
+    This is `KeyType(expression).key_material(bits)`. The result is cached,
+    since test generators request the same few combinations many times.
+    """
+    return KeyType.intern(expression).make_key_material(bits)
+
+
 class AlgorithmCategory(enum.Enum):
     """PSA algorithm categories."""
     # The numbers are aligned with the category bits in numerical values of
@@ -449,6 +490,23 @@ class Algorithm:
         self.category = self.determine_category(self.base_expression, self.head)
         self.is_wildcard = self.determine_wildcard(self.expression)
 
+    _interned = {} #type: Dict[str, Algorithm]
+
+    @classmethod
+    def intern(cls, expr: str) -> 'Algorithm':
+        """Return a shared object describing the given algorithm.
+
+        All the calls for expressions that only differ in whitespace return
+        the same object, so each algorithm is only analyzed once. Callers
+        must not modify the returned object.
+        """
+        expression = re.sub(r'\s+', r'', expr)
+        alg = cls._interned.get(expression)
+        if alg is None:
+            alg = cls(expression)
+            cls._interned[expression] = alg
+        return alg
+
     def get_key_agreement_derivation(self) -> Optional[str]:
         """For a combined key agreement and key derivation algorithm, get the derivation part.
 
@@ -608,3 +666,50 @@ class Algorithm:
         else:
             raise AlgorithmNotRecognized(self.expression)
         return ['PSA_KEY_USAGE_' + flag for flag in flags]
+
+
+class CompatibilityMatrix:
+    """Precomputed compatibility between key types, algorithms and categories.
+
+    This answers the same questions as `KeyType.can_do()` and
+    `Algorithm.can_do()` by looking up a table that is filled once,
+    which matters when enumerating all combinations of key types,
+    algorithms and operation categories.
+    """
+
+    def __init__(self,
+                 key_types: Iterable[KeyType],
+                 algorithms: Iterable[Algorithm]) -> None:
+        self.key_types = list(key_types)
+        self.algorithms = list(algorithms)
+        self._key_can_do = {} #type: Dict[Tuple[str, str], bool]
+        self._alg_categories = {} #type: Dict[str, FrozenSet[AlgorithmCategory]]
+        for alg in self.algorithms:
+            self._categories_of(alg)
+            for kt in self.key_types:
+                self.key_can_do(kt, alg)
+
+    def _categories_of(self, alg: Algorithm) -> FrozenSet[AlgorithmCategory]:
+        categories = self._alg_categories.get(alg.expression)
+        if categories is None:
+            categories = frozenset(category for category in AlgorithmCategory
+                                   if alg.can_do(category))
+            self._alg_categories[alg.expression] = categories
+        return categories
+
+    def key_can_do(self, kt: KeyType, alg: Algorithm) -> bool:
+        """Equivalent to ``kt.can_do(alg)``."""
+        key = (kt.expression, alg.expression)
+        result = self._key_can_do.get(key)
+        if result is None:
+            result = kt.can_do(alg)
+            self._key_can_do[key] = result
+        return result
+
+    def alg_can_do(self, alg: Algorithm, category: AlgorithmCategory) -> bool:
+        """Equivalent to ``alg.can_do(category)``."""
+        return category in self._categories_of(alg)
+
+    def compatible_algorithms(self, kt: KeyType) -> List[Algorithm]:
+        """The algorithms in `self.algorithms` that can be used with `kt`."""
+        return [alg for alg in self.algorithms if self.key_can_do(kt, alg)]
@@ -5,23 +5,35 @@
 # SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
 
 import argparse
+import concurrent.futures
+import contextlib
+import difflib
 import filecmp
+import io
+import os
+import runpy
 import shutil
 import subprocess
 import sys
+import tempfile
+import time
+import traceback
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import stream_compare
 
 class GenerationScript:
     """
     Representation of a script generating a configuration independent file.
     """
     # pylint: disable=too-few-public-methods,too-many-arguments
-    def __init__(self, script: Path, files: List[Path],
+    def __init__(self, script: Path, files: Optional[List[Path]],
                  output_dir_option: Optional[str] = None,
                  output_file_option: Optional[str] = None,
-                 optional: bool = False) -> None:
+                 optional: bool = False,
+                 depends_on: Optional[List[Path]] = None) -> None:
         # Path from the root of Mbed TLS or TF-PSA-Crypto of the generation script
         self.script = script
 
@@ -32,8 +44,10 @@ class GenerationScript:
             self.exe = "perl"
 
         # List of the default paths from the Mbed TLS or TF-PSA-Crypto root of the
-        # files the script generates.
-        self.files = files
+        # files the script generates. If None, the list is obtained by running
+        # the script with the "--list" option when it is first needed
+        # (see `discover_files` to do this for many scripts in parallel).
+        self._files = files
 
         # Output directory script argument. Can be an empty string in case it is a
         # positional argument.
@@ -49,6 +63,42 @@ class GenerationScript:
         # consuming repository hasn't been updated yet.
         self.optional = optional
 
+        # Generation scripts that must have run before this one, e.g. because
+        # this script lists or reads files that they generate. Scripts that
+        # are not part of the current run are ignored.
+        self.depends_on = [] if depends_on is None else depends_on
+
+    @property
+    def files(self) -> List[Path]:
+        if self._files is None:
+            self._files = get_generation_script_files(str(self.script))
+        return self._files
+
+    def files_known(self) -> bool:
+        """Whether the list of generated files has already been determined."""
+        return self._files is not None
+
+    def command(self, root: Optional[Path] = None) -> List[str]:
+        """The command to run the script.
+
+        If `root` is None, the script writes its files to their default
+        location. Otherwise pass the output options so that the files are
+        written under `root`.
+        """
+        command = [self.exe, str(self.script)]
+        if root is not None:
+            if self.output_dir_option is not None:
+                command += [self.output_dir_option,
+                            str(root / Path(self.files[0].parent))]
+            elif self.output_file_option is not None:
+                command += self.output_file_option.split()
+                command += [str(root / Path(self.files[0]))]
+        return [item for item in command if item.strip()]
+
+    def can_run_in_process(self) -> bool:
+        """Whether this script can be run with `run_python_in_process`."""
+        return self.script.suffix == ".py"
+
 def get_generation_script_files(generation_script: str) -> List[Path]:
     """
     Get the list of the default paths of the files that a given script
@@ -67,6 +117,167 @@ def get_generation_script_files(generation_script: str) -> List[Path]:
 
     return files
 
+def discover_files(generation_scripts: Iterable[GenerationScript],
+                   jobs: int = 1) -> None:
+    """Determine the list of generated files for all the given scripts.
+
+    Run the ``--list`` queries that haven't been made yet, up to `jobs`
+    of them concurrently.
+    """
+    pending = [generation_script
+               for generation_script in generation_scripts
+               if not generation_script.files_known()]
+    if not pending:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        # Accessing `files` runs the query and caches its result.
+        # Consume the results to propagate any exception.
+        for _ in executor.map(lambda generation_script: generation_script.files,
+                              pending):
+            pass
+
+def run_command(command: List[str]) -> Tuple[int, str, float]:
+    """Run a command, capturing its output.
+
+    Return ``(returncode, output, elapsed)`` where ``output`` is the combined
+    standard output and standard error, and ``elapsed`` is the wall clock
+    time in seconds.
+    """
+    start = time.monotonic()
+    proc = subprocess.run(command,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True, check=False)
+    return proc.returncode, proc.stdout, time.monotonic() - start
+
+def run_python_in_process(command: List[str]) -> Tuple[int, str, float]:
+    """Run a Python script in the current process, capturing its output.
+
+    `command` is a command line as for `run_command`, starting with the
+    Python interpreter, which is ignored. The script is executed as the
+    ``__main__`` module, with ``sys.argv`` set to the rest of the command
+    line. Modules imported by the script stay loaded, so caches in the
+    ``mbedtls_framework`` modules, such as the parsed PSA interface (see
+    `psa_information.shared_information`) and ``psa_storage.Expr.value_cache``,
+    are shared between scripts that run in the same process. Configuration
+    files are not shared: each script that needs them parses them itself.
+    The test data targets of a script are not generated by the scripts that
+    run after it (see `test_data_generation.mark_earlier_targets`).
+
+    The working directory, ``sys.argv`` and ``sys.path`` are restored
+    afterwards. Return the same information as `run_command`.
+    """
+    script = command[1]
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    saved_cwd = os.getcwd()
+    output = io.StringIO()
+    returncode = 0
+    start = time.monotonic()
+    sys.argv = command[1:]
+    # Like the interpreter does when running a script.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        with contextlib.redirect_stdout(output), \
+             contextlib.redirect_stderr(output):
+            try:
+                runpy.run_path(script, run_name='__main__')
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+                else:
+                    output.write(str(e.code) + '\n')
+                    returncode = 1
+            except Exception: #pylint: disable=broad-except
+                traceback.print_exc(file=output)
+                returncode = 1
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        os.chdir(saved_cwd)
+        # Keep the test data targets of this script away from the next ones.
+        # Only do this if the script loaded test_data_generation, to avoid
+        # loading it needlessly.
+        test_data_generation = sys.modules.get(__package__ + '.test_data_generation')
+        if test_data_generation is not None:
+            test_data_generation.mark_earlier_targets()
+    return returncode, output.getvalue(), time.monotonic() - start
+
+def run_generation_script(generation_script: GenerationScript,
+                          command: List[str],
+                          in_process: bool = False) -> None:
+    """Run one generation script and print its output.
+
+    Raise an exception if the script fails.
+    """
+    if in_process and generation_script.can_run_in_process():
+        returncode, output, _ = run_python_in_process(command)
+    else:
+        returncode, output, _ = run_command(command)
+    sys.stdout.write(output)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output)
+
+def run_generation_scripts(
+        generation_scripts: List[GenerationScript],
+        command_for: Callable[[GenerationScript], List[str]],
+        jobs: int = 1,
+        in_process: bool = False
+) -> Dict[Path, float]:
+    """Run generation scripts concurrently, respecting their dependencies.
+
+    Each script is run with the command returned by `command_for` once all
+    the scripts listed in its `depends_on` attribute have completed.
+    Up to `jobs` scripts run at the same time. The output of each script
+    is captured and printed in one block when it completes, followed by
+    its run time.
+
+    If `in_process` is true, Python scripts are run in this process with
+    `run_python_in_process`, one at a time, while other scripts keep
+    running in subprocesses.
+
+    Return a dictionary mapping each script to its run time in seconds.
+    Raise an exception if a script fails.
+    """
+    in_run = frozenset(generation_script.script
+                       for generation_script in generation_scripts)
+    pending = list(generation_scripts)
+    done = set()
+    timings = {} #type: Dict[Path, float]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        running = {} #type: Dict[concurrent.futures.Future, GenerationScript]
+        while pending or running:
+            for generation_script in list(pending):
+                if all(dep in done or dep not in in_run
+                       for dep in generation_script.depends_on):
+                    pending.remove(generation_script)
+                    command = command_for(generation_script)
+                    if in_process and generation_script.can_run_in_process():
+                        # The script changes process-wide state such as
+                        # the current directory, so run it synchronously.
+                        future = concurrent.futures.Future() #type: concurrent.futures.Future
+                        future.set_result(run_python_in_process(command))
+                    else:
+                        future = executor.submit(run_command, command)
+                    running[future] = generation_script
+            if not running:
+                raise Exception('Circular dependencies between generation scripts: ' +
+                                ', '.join(str(gs.script) for gs in pending))
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                generation_script = running.pop(future)
+                returncode, output, elapsed = future.result()
+                sys.stdout.write(output)
+                print(f"{generation_script.script}: {elapsed:.2f}s")
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(
+                        returncode, command_for(generation_script), output)
+                done.add(generation_script.script)
+                timings[generation_script.script] = elapsed
+    return timings
+
 def get_generated_files(generation_scripts: List[GenerationScript]) -> List[Path]:
     """
     List the generated files in Mbed TLS or TF-PSA-Crypto. The path from root
@@ -78,19 +289,28 @@ def get_generated_files(generation_scripts: List[GenerationScript]) -> List[Path
 
     return files
 
-def make_generated_files(generation_scripts: List[GenerationScript]) -> None:
+def make_generated_files(generation_scripts: List[GenerationScript],
+                         jobs: int = 1,
+                         in_process: bool = False) -> None:
     """
     Generate the configuration independent files in their default location in
     the Mbed TLS or TF-PSA-Crypto tree.
+
+    Run up to `jobs` generation scripts concurrently. If `in_process` is
+    true, run Python scripts in this process.
     """
-    for generation_script in generation_scripts:
-        subprocess.run([generation_script.exe, str(generation_script.script)], check=True)
+    run_generation_scripts(generation_scripts,
+                           lambda generation_script: generation_script.command(),
+                           jobs, in_process)
 
 def check_generated_files(generation_scripts: List[GenerationScript],
-                          root: Path) -> bool:
+                          root: Path,
+                          in_process: bool = False) -> bool:
     """
     Check that the given root directory contains the generated files as expected/
     generated by this script.
+
+    If `in_process` is true, run Python scripts in this process.
     """
     ok = True
     for generation_script in generation_scripts:
@@ -110,14 +330,9 @@ def check_generated_files(generation_scripts: List[GenerationScript],
                 bak_file.unlink()
             file.rename(bak_file)
 
-        command = [generation_script.exe, str(generation_script.script)]
-        if generation_script.output_dir_option is not None:
-            command += [generation_script.output_dir_option,
-                        str(root / Path(generation_script.files[0].parent))]
-        elif generation_script.output_file_option is not None:
-            command += generation_script.output_file_option.split()
-            command += [str(root / Path(generation_script.files[0]))]
-        subprocess.run([item for item in command if item.strip()], check=True)
+        run_generation_script(generation_script,
+                              generation_script.command(root),
+                              in_process)
 
         for file in generation_script.files:
             file = root / file
@@ -138,6 +353,63 @@ def check_generated_files(generation_scripts: List[GenerationScript],
             bak_file.rename(file)
     return ok
 
+def diff_summary(expected: Path, actual: Path, max_lines: int = 20) -> str:
+    """Return the start of a unified diff between two text files."""
+    with open(expected, encoding='utf-8', errors='replace') as input_file:
+        expected_lines = input_file.readlines()
+    with open(actual, encoding='utf-8', errors='replace') as input_file:
+        actual_lines = input_file.readlines()
+    diff = list(difflib.unified_diff(expected_lines, actual_lines,
+                                     str(expected), str(actual)))
+    summary = ''.join(diff[:max_lines])
+    if len(diff) > max_lines:
+        summary += f"... ({len(diff) - max_lines} more diff lines)\n"
+    return summary
+
+def check_generated_files_out_of_tree(generation_scripts: List[GenerationScript],
+                                      root: Path,
+                                      jobs: int = 1,
+                                      in_process: bool = False) -> bool:
+    """
+    Check that the given root directory contains the generated files as expected/
+    generated by this script, without modifying it.
+
+    The scripts write their files under a private temporary directory, up to
+    `jobs` of them concurrently. Each file is then compared with the
+    corresponding file under `root`, and a unified diff is printed
+    for each mismatch. This can run while other jobs use the same tree.
+    """
+    discover_files(generation_scripts, jobs)
+    with tempfile.TemporaryDirectory(prefix='generated-files-') as temp_dir:
+        temp_root = Path(temp_dir)
+        for generation_script in generation_scripts:
+            for file in generation_script.files:
+                (temp_root / file).parent.mkdir(parents=True, exist_ok=True)
+        run_generation_scripts(
+            generation_scripts,
+            lambda generation_script: generation_script.command(temp_root),
+            jobs, in_process)
+
+        ok = True
+        for generation_script in generation_scripts:
+            for file in generation_script.files:
+                expected = root / file
+                actual = temp_root / file
+                if not expected.exists():
+                    # See check_generated_files().
+                    if generation_script.optional:
+                        continue
+                    raise Exception(f"Expected generated file does not exist: {expected}")
+                if not actual.exists():
+                    ok = False
+                    print(f"Generated file {file} was not produced by "
+                          f"{generation_script.script}.")
+                elif not stream_compare.compare_files(str(expected), str(actual)):
+                    ok = False
+                    print(f"Generated file {expected} is not up to date:")
+                    sys.stdout.write(diff_summary(expected, actual))
+    return ok
+
 def main(generation_scripts: List[GenerationScript]) -> int:
     """
     Main function of this program
@@ -151,17 +423,39 @@ def main(generation_scripts: List[GenerationScript]) -> int:
                               to check (default: Mbed TLS or TF-PSA-Cryto root.)')
     parser.add_argument('--check', action='store_true',
                         default=False, help='Check the generated files in root')
+    parser.add_argument('--out-of-tree', action='store_true',
+                        default=False,
+                        help='With --check, generate the files in a temporary \
+                              directory and compare them with the files in \
+                              root, without modifying root')
+    parser.add_argument('--jobs', '-j', metavar='N', type=int,
+                        default=1,
+                        help='Number of scripts to run in parallel \
+                              (default: 1)')
+    parser.add_argument('--in-process', action='store_true',
+                        default=False,
+                        help='Run Python scripts in this process, which \
+                              shares caches such as parsed PSA headers \
+                              between scripts')
 
     args = parser.parse_args()
 
     if args.list:
+        discover_files(generation_scripts, args.jobs)
         files = get_generated_files(generation_scripts)
         for file in files:
             print(str(file))
         return 0
     elif args.check:
-        ok = check_generated_files(generation_scripts, Path(args.root or "."))
+        if args.out_of_tree:
+            ok = check_generated_files_out_of_tree(generation_scripts,
+                                                   Path(args.root or "."),
+                                                   args.jobs, args.in_process)
+        else:
+            discover_files(generation_scripts, args.jobs)
+            ok = check_generated_files(generation_scripts, Path(args.root or "."),
+                                       args.in_process)
         return 0 if ok else 1
     else:
-        make_generated_files(generation_scripts)
+        make_generated_files(generation_scripts, args.jobs, args.in_process)
         return 0 # Any error causes an exception
@@ -109,6 +109,10 @@ class PSAMacroEnumerator:
         self.include_intermediate = False
         # Deprecated backward compatibility alias for generate_psa_constants.py.
         self.ka_algorithms = self.key_agreement_algorithms
+        # Memoized results of expressions_for_name() and expressions_for().
+        # See clear_expression_cache().
+        self._expressions_for_name = {} #type: Dict[str, Tuple[str, ...]]
+        self._expressions_for_type = {} #type: Dict[str, Tuple[str, ...]]
 
     def is_internal_name(self, name: str) -> bool:
         """Whether this is an internal macro. Internal macros will be skipped."""
@@ -119,11 +123,34 @@ class PSAMacroEnumerator:
                 return True
         return name.endswith('_FLAG') or name.endswith('_MASK')
 
+    def get_names(self, type_word: str) -> Set[str]:
+        """Return the set of known names of values of the given type."""
+        return {
+            'status': self.statuses,
+            'algorithm': self.algorithms,
+            'ecc_curve': self.ecc_curves,
+            'dh_group': self.dh_groups,
+            'key_type': self.key_types,
+            'key_usage': self.key_usage_flags,
+        }[type_word]
+
+    def clear_expression_cache(self) -> None:
+        """Forget memoized expressions.
+
+        Expressions are memoized on first use, and assume that the known
+        names and argument values don't change afterwards. This method is
+        called by `gather_arguments`. Call it if you modify the known names
+        or argument values after enumerating expressions.
+        """
+        self._expressions_for_name.clear()
+        self._expressions_for_type.clear()
+
     def gather_arguments(self) -> None:
         """Populate the list of values for macro arguments.
 
         Call this after parsing all the inputs.
         """
+        self.clear_expression_cache()
         self.arguments_for['hash_alg'] = sorted(self.hash_algorithms)
         self.arguments_for['mac_alg'] = sorted(self.mac_algorithms)
         self.arguments_for['ka_alg'] = sorted(self.key_agreement_algorithms)
@@ -180,16 +207,117 @@ class PSAMacroEnumerator:
         except BaseException as e:
             raise Exception('distribute_arguments({})'.format(name)) from e
 
+    def expressions_for_name(self, name: str) -> Tuple[str, ...]:
+        """Return the results of `distribute_arguments(name)`, memoized.
+
+        See `clear_expression_cache` regarding memoization.
+        """
+        if name not in self._expressions_for_name:
+            self._expressions_for_name[name] = \
+                tuple(self.distribute_arguments(name))
+        return self._expressions_for_name[name]
+
     def distribute_arguments_without_duplicates(
             self, seen: Set[str], name: str
     ) -> Iterator[str]:
         """Same as `distribute_arguments`, but don't repeat seen results."""
-        for result in self.distribute_arguments(name):
+        for result in self.expressions_for_name(name):
             if result not in seen:
                 seen.add(result)
                 yield result
 
-    def generate_expressions(self, names: Iterable[str]) -> Iterator[str]:
+    def _argument_values(self, name: str) -> List[List[str]]:
+        """The distinct values of each argument of the given macro."""
+        return [list(dict.fromkeys(self.arguments_for[arg]))
+                for arg in self.argspecs.get(name, [])]
+
+    def distribute_arguments_cartesian(self, name: str) -> Iterator[str]:
+        """Generate macro calls with every combination of tested arguments.
+
+        Unlike `distribute_arguments`, which varies one argument at a time,
+        this generates the full cartesian product of the argument values,
+        without duplicates.
+        """
+        if name not in self.argspecs:
+            yield name
+            return
+        for arguments in itertools.product(*self._argument_values(name)):
+            yield self._format_arguments(name, arguments)
+
+    @staticmethod
+    def _split_call(expr: str) -> Optional[Tuple[str, List[str]]]:
+        """Split "NAME(arg1, ..., argN)" into its name and top-level arguments.
+
+        Return None if `expr` is not a macro call.
+        """
+        m = re.match(r'(\w+)\((.*)\)\Z', expr)
+        if not m:
+            return None
+        arguments = []
+        depth = 0
+        start = 0
+        inner = m.group(2)
+        for i, c in enumerate(inner):
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif c == ',' and depth == 0:
+                arguments.append(inner[start:i].strip())
+                start = i + 1
+        arguments.append(inner[start:].strip())
+        return m.group(1), arguments
+
+    def _cartesian_duplicates(self, names: List[str]) -> Set[str]:
+        """The elements of `names` that are also generated from another name
+        in cartesian mode.
+
+        Some names are already macro calls, e.g. algorithms found in
+        test cases.
+        """
+        constructors = {}
+        for name in names:
+            if name in self.argspecs:
+                constructors[name] = [set(values)
+                                      for values in self._argument_values(name)]
+        duplicates = set()
+        for name in names:
+            if name in constructors:
+                continue
+            call = self._split_call(name)
+            if call is None or call[0] not in constructors:
+                continue
+            argument_sets = constructors[call[0]]
+            if len(call[1]) == len(argument_sets) and \
+               all(argument in values
+                   for argument, values in zip(call[1], argument_sets)):
+                duplicates.add(name)
+        return duplicates
+
+    def expression_count(self, names: Iterable[str],
+                         cartesian: bool = False) -> int:
+        """Return the number of expressions that `generate_expressions` yields.
+
+        In cartesian mode, this is computed without enumerating the
+        expressions, so it is cheap even when the expressions are too
+        many to enumerate.
+        """
+        if not cartesian:
+            return sum(1 for _ in self.generate_expressions(names))
+        unique_names = list(dict.fromkeys(names))
+        count = 0
+        for name in unique_names:
+            if name in self.argspecs:
+                product = 1
+                for values in self._argument_values(name):
+                    product *= len(values)
+                count += product
+            else:
+                count += 1
+        return count - len(self._cartesian_duplicates(unique_names))
+
+    def generate_expressions(self, names: Iterable[str],
+                             cartesian: bool = False) -> Iterator[str]:
         """Generate expressions covering values constructed from the given names.
 
         `names` can be any iterable collection of macro names.
@@ -200,13 +328,38 @@ class PSAMacroEnumerator:
           every known hash algorithm ``h``.
         * ``macros.generate_expressions(macros.key_types)`` generates all
           key types.
+
+        If `cartesian` is true, generate every combination of argument values
+        for macros with several arguments (see
+        `distribute_arguments_cartesian`). The result is generated lazily,
+        since it can be very large: call `expression_count` first to
+        know its size.
         """
+        if cartesian:
+            unique_names = list(dict.fromkeys(names))
+            duplicates = self._cartesian_duplicates(unique_names)
+            return itertools.chain(*(
+                self.distribute_arguments_cartesian(name)
+                for name in unique_names
+                if name not in duplicates
+            ))
         seen = set() #type: Set[str]
         return itertools.chain(*(
             self.distribute_arguments_without_duplicates(seen, name)
             for name in names
         ))
 
+    def expressions_for(self, type_word: str) -> Tuple[str, ...]:
+        """Return the expressions covering values of the given type.
+
+        `type_word` is as for `get_names`. The result is sorted, without
+        duplicates, and memoized (see `clear_expression_cache`).
+        """
+        if type_word not in self._expressions_for_type:
+            self._expressions_for_type[type_word] = tuple(sorted(
+                self.generate_expressions(self.get_names(type_word))))
+        return self._expressions_for_type[type_word]
+
 
 class PSAMacroCollector(PSAMacroEnumerator):
     """Collect PSA crypto macro definitions from C header files.
@@ -278,6 +431,15 @@ class PSAMacroCollector(PSAMacroEnumerator):
     _define_directive_re = re.compile(r'\s*#\s*define\s+(\w+)' +
                                       r'(?:\s+|\((\w+)\)\s*)' +
                                       r'(.+)')
+    # Classify a macro name by its prefix. The name of the group that
+    # matches (`lastgroup`) is the category.
+    _name_category_re = re.compile(r'PSA_(?:' +
+                                   r'(?P<status>ERROR_|SUCCESS\Z)|' +
+                                   r'(?P<key_type>KEY_TYPE_)|' +
+                                   r'(?P<ecc_curve>ECC_FAMILY_)|' +
+                                   r'(?P<dh_group>DH_FAMILY_)|' +
+                                   r'(?P<algorithm>ALG_)|' +
+                                   r'(?P<key_usage>KEY_USAGE_))')
     _deprecated_definition_re = re.compile(r'\s*MBEDTLS_DEPRECATED')
 
     # Macro that is a destructor, not a constructor (i.e. takes a thing as
@@ -305,7 +467,11 @@ class PSAMacroCollector(PSAMacroEnumerator):
         (up to non-significant whitespace) and skips all non-matching lines.
         """
         # pylint: disable=too-many-branches,too-many-return-statements
-        m = re.match(self._define_directive_re, line)
+        # Cheap rejection of the vast majority of lines, which are not
+        # preprocessor directives.
+        if not line.lstrip().startswith('#'):
+            return
+        m = self._define_directive_re.match(line)
         if not m:
             return
         name, parameter, expansion = m.groups()
@@ -326,29 +492,30 @@ class PSAMacroCollector(PSAMacroEnumerator):
         if self.is_internal_name(name):
             # Macro only to build actual values
             return
-        elif (name.startswith('PSA_ERROR_') or name == 'PSA_SUCCESS') \
-           and not parameter:
+        category_match = self._name_category_re.match(name)
+        category = category_match.lastgroup if category_match else None
+        if category == 'status' and not parameter:
             self.statuses.add(name)
-        elif name.startswith('PSA_KEY_TYPE_') and not parameter:
+        elif category == 'key_type' and not parameter:
             self.key_types.add(name)
-        elif name.startswith('PSA_KEY_TYPE_') and parameter == 'curve':
+        elif category == 'key_type' and parameter == 'curve':
             self.key_types_from_curve[name] = name[:13] + 'IS_' + name[13:]
-        elif name.startswith('PSA_KEY_TYPE_') and parameter == 'group':
+        elif category == 'key_type' and parameter == 'group':
             self.key_types_from_group[name] = name[:13] + 'IS_' + name[13:]
-        elif name.startswith('PSA_ECC_FAMILY_') and not parameter:
+        elif category == 'ecc_curve' and not parameter:
             self.ecc_curves.add(name)
-        elif name.startswith('PSA_DH_FAMILY_') and not parameter:
+        elif category == 'dh_group' and not parameter:
             self.dh_groups.add(name)
-        elif name.startswith('PSA_ALG_') and not parameter:
+        elif category == 'algorithm' and not parameter:
             if name in ['PSA_ALG_ECDSA_BASE',
                         'PSA_ALG_RSA_PKCS1V15_SIGN_BASE']:
                 # Ad hoc skipping of duplicate names for some numerical values
                 return
             self.algorithms.add(name)
             self.record_algorithm_subtype(name, expansion)
-        elif name.startswith('PSA_ALG_') and parameter == 'hash_alg':
+        elif category == 'algorithm' and parameter == 'hash_alg':
             self.algorithms_from_hash[name] = self.algorithm_tester(name)
-        elif name.startswith('PSA_KEY_USAGE_') and not parameter:
+        elif category == 'key_usage' and not parameter:
             self.key_usage_flags.add(name)
         elif parameter is None:
             # Macro with no parameter, whose name does not start with one
@@ -359,14 +526,16 @@ class PSAMacroCollector(PSAMacroEnumerator):
                             .format(name, parameter))
 
     _nonascii_re = re.compile(rb'[^\x00-\x7f]+')
-    _continued_line_re = re.compile(rb'\\\r?\n\Z')
+    _continued_line_endings = (b'\\\n', b'\\\r\n')
     def read_file(self, header_file):
         for line in header_file:
-            m = re.search(self._continued_line_re, line)
-            while m:
+            while line.endswith(self._continued_line_endings):
                 cont = next(header_file)
-                line = line[:m.start(0)] + cont
-                m = re.search(self._continued_line_re, line)
+                line = line[:line.rindex(b'\\')] + cont
+            # Only directives are of interest, and they contain '#'.
+            # Check this on the raw bytes, before the expensive decoding.
+            if b'#' not in line:
+                continue
             line = re.sub(self._nonascii_re, rb'', line).decode('ascii')
             self.read_line(line)
 
@@ -466,23 +635,12 @@ enumerate
         # and this only applies to known algorithms, so don't test an
         # unknown algorithm.
 
-    def get_names(self, type_word: str) -> Set[str]:
-        """Return the set of known names of values of the given type."""
-        return {
-            'status': self.statuses,
-            'algorithm': self.algorithms,
-            'ecc_curve': self.ecc_curves,
-            'dh_group': self.dh_groups,
-            'key_type': self.key_types,
-            'key_usage': self.key_usage_flags,
-        }[type_word]
-
     # Regex for interesting header lines.
-    # Groups: 1=macro name, 2=type, 3=argument list (optional).
+    # Groups: name=macro name, type=type, args=argument list (optional).
     _header_line_re = \
         re.compile(r'#define +' +
-                   r'(PSA_((?:(?:DH|ECC|KEY)_)?[A-Z]+)_\w+)' +
-                   r'(?:\(([^\n()]*)\))?')
+                   r'(?P<name>PSA_(?P<type>(?:(?:DH|ECC|KEY)_)?[A-Z]+)_\w+)' +
+                   r'(?:\((?P<args>[^\n()]*)\))?')
     # Regex of macro names to exclude.
     _excluded_name_re = re.compile(r'_(?:GET|HAS|IS|OF)_|_(?:BASE|FLAG|MASK)\Z')
     # Additional excluded macros.
@@ -497,27 +655,35 @@ enumerate
     ])
     def parse_header_line(self, line: str) -> None:
         """Parse a C header line, looking for "#define PSA_xxx"."""
-        m = re.match(self._header_line_re, line)
+        # Cheap rejection of the vast majority of lines.
+        if not line.startswith('#define'):
+            return
+        m = self._header_line_re.match(line)
         if not m:
             return
-        name = m.group(1)
+        name = m.group('name')
         self.all_declared.add(name)
-        if re.search(self._excluded_name_re, name) or \
-           name in self._excluded_names or \
+        if name in self._excluded_names or \
+           re.search(self._excluded_name_re, name) or \
            self.is_internal_name(name):
             return
-        dest = self.table_by_prefix.get(m.group(2))
+        dest = self.table_by_prefix.get(m.group('type'))
         if dest is None:
             return
         dest.add(name)
-        if m.group(3):
-            self.argspecs[name] = self._argument_split(m.group(3))
+        args = m.group('args')
+        if args:
+            self.argspecs[name] = self._argument_split(args)
 
     _nonascii_re = re.compile(rb'[^\x00-\x7f]+') #type: Pattern
     def parse_header(self, filename: str) -> None:
         """Parse a C header file, looking for "#define PSA_xxx"."""
         with open(filename, 'rb') as input_:
             for line in input_:
+                # Only "#define" lines are of interest. Removing non-ASCII
+                # characters can't create a '#', so check this first.
+                if b'#' not in line:
+                    continue
                 line = re.sub(self._nonascii_re, rb'', line)
                 self.parse_header_line(line.decode('ascii'))
 
@@ -0,0 +1,243 @@
+"""Cache data that is expensive to compute on disk, across runs of the scripts.
+
+The cache lives in the directory ``.cache`` at the root of the framework
+checkout, which is ignored by git. Set the environment variable
+``MBEDTLS_FRAMEWORK_CACHE`` to use a different directory, or to an empty
+string to disable the cache.
+
+Each cache entry is a file whose name contains a hash of everything that
+the cached data depends on, so there is no need to invalidate entries:
+a change in the inputs just leads to a different file name. Stale entries
+can be removed at any time, e.g. with ``rm -r framework/.cache``. To keep
+the cache from growing forever, saving an entry removes the least recently
+used entries of the same kind beyond a maximum total size (see `trim`).
+"""
+
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+#
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+from typing import Any, Callable, IO, Iterable, Optional
+
+CACHE_DIRECTORY_ENV = 'MBEDTLS_FRAMEWORK_CACHE'
+
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+"""Default maximum total size of the entries of one kind, in bytes."""
+
+# The root of the framework checkout.
+_FRAMEWORK_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+def cache_directory() -> Optional[str]:
+    """Return the directory for persistent cache files.
+
+    Return None if the persistent cache is disabled.
+    """
+    directory = os.getenv(CACHE_DIRECTORY_ENV)
+    if directory is None:
+        return os.path.join(_FRAMEWORK_ROOT, '.cache')
+    if not directory:
+        return None
+    return directory
+
+def file_hash(filename: str) -> str:
+    """Return the SHA-256 hash of the content of the given file, in hex.
+
+    Line endings are normalized to LF first, so that the result doesn't
+    depend on how the file was checked out.
+    """
+    hasher = hashlib.sha256()
+    with open(filename, 'rb') as input_file:
+        pending_cr = False
+        for chunk in iter(lambda: input_file.read(65536), b''):
+            if pending_cr:
+                chunk = b'\r' + chunk
+            # Keep a trailing CR for the next chunk, in case it's a CRLF.
+            pending_cr = chunk.endswith(b'\r')
+            if pending_cr:
+                chunk = chunk[:-1]
+            hasher.update(chunk.replace(b'\r\n', b'\n'))
+        if pending_cr:
+            hasher.update(b'\r')
+    return hasher.hexdigest()
+
+def hash_files(filenames: Iterable[str]) -> str:
+    """Return a hash of the names and contents of the given files, in hex."""
+    hasher = hashlib.sha256()
+    for filename in filenames:
+        hasher.update(filename.encode('utf-8') + b'\0')
+        hasher.update(bytes.fromhex(file_hash(filename)))
+    return hasher.hexdigest()
+
+def header_files(include_path: Iterable[str]) -> Iterable[str]:
+    """List the C header files in the given directories and their subdirectories.
+
+    The files are listed in a deterministic order.
+    """
+    for include_dir in include_path:
+        for dirpath, dirnames, filenames in os.walk(include_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.h'):
+                    yield os.path.join(dirpath, filename)
+
+def c_compilation_key(include_path: Iterable[str], *extra: str) -> str:
+    """Return a key for data obtained by compiling and running C code.
+
+    The key covers the include path, the content of all the headers on it,
+    the compiler selected through the environment, the platform, and any
+    `extra` strings passed by the caller (e.g. the C code itself).
+    """
+    include_path = list(include_path)
+    hasher = hashlib.sha256()
+    for item in [sys.platform,
+                 os.getenv('HOSTCC', ''), os.getenv('CC', ''),
+                 *include_path,
+                 hash_files(header_files(include_path)),
+                 *extra]:
+        hasher.update(item.encode('utf-8') + b'\0')
+    return hasher.hexdigest()
+
+def entry_path(kind: str, key: str, suffix: str = '') -> Optional[str]:
+    """Return the path of the cache entry of the given kind for the given key.
+
+    Return None if the persistent cache is disabled. The entry may not exist.
+    """
+    directory = cache_directory()
+    if directory is None:
+        return None
+    return os.path.join(directory, '{}-{}{}'.format(kind, key, suffix))
+
+def touch(path: str) -> None:
+    """Mark a cache entry as recently used, for `trim()`."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def trim(kind: str, max_size: int) -> None:
+    """Remove the least recently used entries of the given kind.
+
+    Keep the most recently used entries (according to their modification
+    time, see `touch()`) whose total size is at most `max_size` bytes.
+    """
+    directory = cache_directory()
+    if directory is None:
+        return
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.startswith(kind + '-') and \
+                   not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    entries.sort(reverse=True)
+    total = 0
+    for _mtime, size, path in entries:
+        total += size
+        if total > max_size:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# Errors that make a cache entry unusable, for reading or for writing.
+# An unreadable entry is treated as absent, and a failure to write an entry
+# is ignored: the cache is only an optimization. Besides I/O errors, this
+# covers corrupted entries (truncated or garbled files), stale pickles (of
+# classes that have changed since they were saved) and data that can't be
+# serialized.
+_ENTRY_ERRORS = (OSError, EOFError, ImportError, ValueError,
+                 TypeError, AttributeError, pickle.PickleError)
+
+def _load(kind: str, key: str, suffix: str,
+          binary: bool, reader: Callable[[IO], Any]) -> Optional[Any]:
+    path = entry_path(kind, key, suffix)
+    if path is None:
+        return None
+    try:
+        if binary:
+            with open(path, 'rb') as input_file:
+                data = reader(input_file)
+        else:
+            with open(path, 'r', encoding='utf-8') as input_file:
+                data = reader(input_file)
+    except _ENTRY_ERRORS:
+        return None
+    touch(path)
+    return data
+
+def _save(kind: str, key: str, suffix: str,
+          binary: bool, writer: Callable[[IO], None],
+          max_size: int) -> None:
+    path = entry_path(kind, key, suffix)
+    if path is None:
+        return
+    temp_name = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(path),
+                                         prefix=kind + '-', suffix='.tmp')
+        if binary:
+            with os.fdopen(fd, 'wb') as output_file:
+                writer(output_file)
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as output_file:
+                writer(output_file)
+        os.replace(temp_name, path)
+        temp_name = None
+    except _ENTRY_ERRORS:
+        pass
+    finally:
+        if temp_name is not None:
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+    trim(kind, max_size)
+
+def load_json(kind: str, key: str) -> Optional[Any]:
+    """Load the cache entry of the given kind for the given key.
+
+    Return None if there is no such entry or if the entry can't be read.
+    """
+    return _load(kind, key, '.json', False, json.load)
+
+def save_json(kind: str, key: str, data: Any,
+              max_size: int = DEFAULT_MAX_SIZE) -> None:
+    """Save a cache entry of the given kind for the given key.
+
+    The entry is replaced atomically, so concurrent readers see either the
+    old content or the new content. Errors are ignored: the cache is only
+    an optimization.
+
+    Then trim the entries of this kind to `max_size` bytes (see `trim`).
+    """
+    _save(kind, key, '.json', False,
+          lambda output_file: json.dump(data, output_file, sort_keys=True),
+          max_size)
+
+def load_pickle(kind: str, key: str) -> Optional[Any]:
+    """Load a pickled cache entry. See `load_json`.
+
+    Only use this for Python objects whose classes are part of the
+    framework, and include the source of those classes in the key.
+    """
+    return _load(kind, key, '.pickle', True, pickle.load)
+
+def save_pickle(kind: str, key: str, data: Any,
+                max_size: int = DEFAULT_MAX_SIZE) -> None:
+    """Save a pickled cache entry. See `save_json`."""
+    _save(kind, key, '.pickle', True,
+          lambda output_file: pickle.dump(data, output_file,
+                                          pickle.HIGHEST_PROTOCOL),
+          max_size)
@@ -5,12 +5,18 @@
 # SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
 #
 
+import functools
+import os
 import re
+import sys
 from collections import OrderedDict
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from . import build_tree
+from . import crypto_knowledge
 from . import macro_collector
+from . import persistent_cache
+from . import psa_storage
 
 
 class Information:
@@ -18,6 +24,7 @@ class Information:
 
     def __init__(self) -> None:
         self.constructors = self.read_psa_interface()
+        self._compatibility_matrix = None #type: Optional[crypto_knowledge.CompatibilityMatrix]
 
     @staticmethod
     def remove_unwanted_macros(
@@ -39,10 +46,13 @@ class Information:
         constructors.key_types.discard('PSA_KEY_TYPE_SPAKE2P_KEY_PAIR')
         constructors.key_types.discard('PSA_KEY_TYPE_SPAKE2P_PUBLIC_KEY')
 
-    def read_psa_interface(self) -> macro_collector.PSAMacroEnumerator:
-        """Return the list of known key types, algorithms, etc."""
-        constructors = macro_collector.InputsForTest()
+    @staticmethod
+    def interface_files() -> Tuple[List[str], List[str]]:
+        """Return the files that describe the PSA interface.
 
+        Return a pair ``(headers, test_suites)`` of lists of paths relative
+        to the project root.
+        """
         if build_tree.looks_like_root('.'):
             if build_tree.looks_like_mbedtls_root('.') and \
                (not build_tree.is_mbedtls_3_6()):
@@ -53,7 +63,42 @@ class Information:
                 header_file_names = ['include/psa/crypto_values.h',
                                      'include/psa/crypto_extra.h']
                 test_suites = ['tests/suites/test_suite_psa_crypto_metadata.data']
+        return header_file_names, test_suites
 
+    PERSISTENT_CACHE_KIND = 'psa_interface'
+
+    def read_psa_interface(self) -> macro_collector.PSAMacroEnumerator:
+        """Return the list of known key types, algorithms, etc.
+
+        The result is saved in the persistent cache (see `persistent_cache`),
+        keyed by the content of the interface files and of the parsing code,
+        so that it is only parsed again when one of them changes.
+        """
+        header_file_names, test_suites = self.interface_files()
+        code_files = [macro_collector.__file__, __file__]
+        # Subclasses may override remove_unwanted_macros().
+        subclass_file = getattr(sys.modules[type(self).__module__],
+                                '__file__', None)
+        if subclass_file is not None:
+            code_files.append(subclass_file)
+        cache_key = persistent_cache.hash_files(
+            header_file_names + test_suites + code_files)
+        constructors = persistent_cache.load_pickle(self.PERSISTENT_CACHE_KIND,
+                                                    cache_key)
+        if isinstance(constructors, macro_collector.InputsForTest):
+            return constructors
+        constructors = self.parse_psa_interface(header_file_names, test_suites)
+        persistent_cache.save_pickle(self.PERSISTENT_CACHE_KIND, cache_key,
+                                     constructors)
+        return constructors
+
+    def parse_psa_interface(
+            self,
+            header_file_names: List[str],
+            test_suites: List[str]
+    ) -> macro_collector.InputsForTest:
+        """Parse the PSA interface. See `read_psa_interface`."""
+        constructors = macro_collector.InputsForTest()
         for header_file_name in header_file_names:
             constructors.parse_header(header_file_name)
         for test_cases in test_suites:
@@ -62,6 +107,58 @@ class Information:
         constructors.gather_arguments()
         return constructors
 
+    def compatibility_matrix(self) -> crypto_knowledge.CompatibilityMatrix:
+        """Return the compatibility between all the key types and algorithms.
+
+        The matrix covers all the key type and algorithm expressions
+        enumerated from the constructors. It is only computed once.
+        """
+        if self._compatibility_matrix is None:
+            constructors = self.constructors
+            key_types = [crypto_knowledge.KeyType.intern(expr)
+                         for expr in constructors.generate_expressions(
+                             sorted(constructors.key_types))]
+            algorithms = [crypto_knowledge.Algorithm.intern(expr)
+                          for expr in constructors.generate_expressions(
+                              sorted(constructors.algorithms))]
+            self._compatibility_matrix = \
+                crypto_knowledge.CompatibilityMatrix(key_types, algorithms)
+        return self._compatibility_matrix
+
+    def storage_expressions(self) -> Iterator[str]:
+        """Enumerate the expressions whose value a key representation may need.
+
+        This covers lifetimes, key types, algorithms and usage flags.
+        """
+        constructors = self.constructors
+        for names in [constructors.lifetimes,
+                      constructors.key_types,
+                      constructors.algorithms,
+                      constructors.key_usage_flags]:
+            yield from constructors.generate_expressions(sorted(names))
+
+    def prefetch_storage_values(self) -> None:
+        """Evaluate all of `storage_expressions()` at once.
+
+        See `psa_storage.Expr.prefetch()`.
+        """
+        psa_storage.Expr.prefetch(self.storage_expressions())
+
+
+_shared_information = {} #type: Dict[str, Information]
+
+def shared_information() -> Information:
+    """Return information about the PSA interface of the current project.
+
+    The headers are only parsed once per process and project root, so that
+    generation scripts running in the same process share the result.
+    Callers must not modify the returned object.
+    """
+    root = os.getcwd()
+    if root not in _shared_information:
+        _shared_information[root] = Information()
+    return _shared_information[root]
+
 
 def psa_want_symbol(name: str, prefix: Optional[str] = None) -> str:
     """Return the PSA_WANT_xxx symbol associated with a PSA crypto feature.
@@ -100,6 +197,19 @@ SYMBOLS_WITHOUT_DEPENDENCY = frozenset([
     'PSA_ALG_KEY_AGREEMENT', # chaining
     'PSA_ALG_TRUNCATED_MAC', # modifier
 ])
+DEPENDENCY_SYMBOL_RE = re.compile(r'PSA_(?:ALG|ECC_FAMILY|DH_FAMILY|KEY_TYPE)_\w+')
+
+AUTOMATIC_DEPENDENCIES_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=AUTOMATIC_DEPENDENCIES_CACHE_SIZE)
+def _automatic_dependencies(expressions: Tuple[str, ...],
+                            prefix: Optional[str]) -> Tuple[str, ...]:
+    used = set()
+    for expr in expressions:
+        used.update(DEPENDENCY_SYMBOL_RE.findall(expr))
+    used.difference_update(SYMBOLS_WITHOUT_DEPENDENCY)
+    return tuple(sorted(psa_want_symbol(name, prefix=prefix) for name in used))
+
 def automatic_dependencies(*expressions: str,
                            prefix: Optional[str] = None) -> List[str]:
     """Infer dependencies of a test case by looking for PSA_xxx symbols.
@@ -111,12 +221,23 @@ def automatic_dependencies(*expressions: str,
     `prefix`: prefix to use in dependencies. Defaults to ``'PSA_WANT_'``.
               Use ``'MBEDTLS_PSA_BUILTIN_'`` when specifically testing
               builtin implementations.
+
+    The result is cached, since many test cases have the same arguments.
+    See `automatic_dependencies_cache_info()`.
     """
-    used = set()
-    for expr in expressions:
-        used.update(re.findall(r'PSA_(?:ALG|ECC_FAMILY|DH_FAMILY|KEY_TYPE)_\w+', expr))
-    used.difference_update(SYMBOLS_WITHOUT_DEPENDENCY)
-    return sorted(psa_want_symbol(name, prefix=prefix) for name in used)
+    # Leave out the arguments that can't contain a symbol, such as key data,
+    # so that more calls share a cache entry.
+    relevant = tuple(expr for expr in expressions if 'PSA_' in expr)
+    return list(_automatic_dependencies(relevant, prefix))
+
+def automatic_dependencies_cache_info():
+    """Return statistics about the cache of `automatic_dependencies()`.
+
+    The result has the fields ``hits``, ``misses``, ``maxsize`` and
+    ``currsize`` (see `functools.lru_cache`).
+    """
+    # pylint gets confused by the lru_cache decorator.
+    return _automatic_dependencies.cache_info() #pylint: disable=no-value-for-parameter
 
 # Define set of regular expressions and dependencies to optionally append
 # extra dependencies for test case based on key description.
@@ -140,7 +261,9 @@ def generate_deps_from_description(
     """
     dep_list = []
     for regex, deps in DEPENDENCY_FROM_DESCRIPTION.items():
-        if re.search(regex, description):
+        # Calling the method of the compiled regex directly is significantly
+        # faster than re.search(), which looks up its own cache first.
+        if regex.search(description):
             dep_list += deps
 
     return dep_list
@@ -12,11 +12,12 @@ before changing how test data is constructed or validated.
 
 import re
 import struct
-from typing import Dict, List, Optional, Set, Union
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
 import unittest
 
 from . import c_build_helper
 from . import build_tree
+from . import persistent_cache
 
 
 class Expr:
@@ -38,9 +39,15 @@ class Expr:
     unknown_values = set() #type: Set[str]
     """Expressions whose values are not present in `value_cache` yet."""
 
-    def update_cache(self) -> None:
-        """Update `value_cache` for expressions registered in `unknown_values`."""
-        expressions = sorted(self.unknown_values)
+    C_HEADER = """
+            #include <psa/crypto.h>
+            """
+    """C code declaring the expressions that `update_cache()` evaluates."""
+
+    @staticmethod
+    def include_path() -> List[str]:
+        """The include path for the C code that evaluates expressions."""
+        includes = [] #type: List[str]
         # Temporary, while Mbed TLS does not just rely on the TF-PSA-Crypto
         # build system to build its crypto library. When it does, the first
         # case can just be removed.
@@ -58,17 +65,70 @@ class Expr:
                 includes.append('tf-psa-crypto/drivers/everest/include')
                 includes.append('tf-psa-crypto/drivers/everest/include/tf-psa-crypto/private/')
                 includes.append('tf-psa-crypto/drivers/pqcp/include')
+        return includes
 
-        values = c_build_helper.get_c_expression_values(
-            'unsigned long', '%lu',
-            expressions,
-            header="""
-            #include <psa/crypto.h>
-            """,
-            include_path=includes) #type: List[str]
-        for e, v in zip(expressions, values):
-            self.value_cache[e] = int(v, 0)
-        self.unknown_values.clear()
+    PERSISTENT_CACHE_KIND = 'psa_expr_values'
+
+    compile_count = 0
+    """Number of times `update_cache()` compiled a C program.
+
+    This is meant for instrumentation: ideally, a process compiles at most
+    once. See `prefetch()`.
+    """
+
+    @classmethod
+    def update_cache(cls) -> None:
+        """Update `value_cache` for expressions registered in `unknown_values`.
+
+        Values are also looked up in, and saved to, a persistent cache
+        (see `persistent_cache`) keyed by the include path and the content
+        of the headers on it, so that the C program only needs to be
+        compiled when the headers change or new expressions show up.
+        """
+        expressions = sorted(cls.unknown_values.difference(cls.value_cache))
+        if not expressions:
+            cls.unknown_values.clear()
+            return
+        includes = cls.include_path()
+        cache_key = persistent_cache.c_compilation_key(includes, cls.C_HEADER)
+        persisted = persistent_cache.load_json(cls.PERSISTENT_CACHE_KIND,
+                                               cache_key)
+        if not isinstance(persisted, dict):
+            persisted = {}
+        missing = [e for e in expressions
+                   if not isinstance(persisted.get(e), int)]
+        if missing:
+            cls.compile_count += 1
+            values = c_build_helper.get_c_expression_values(
+                'unsigned long', '%lu',
+                missing,
+                header=cls.C_HEADER,
+                include_path=includes) #type: List[str]
+            for e, v in zip(missing, values):
+                persisted[e] = int(v, 0)
+            persistent_cache.save_json(cls.PERSISTENT_CACHE_KIND, cache_key,
+                                       persisted)
+        for e in expressions:
+            cls.value_cache[e] = persisted[e]
+        cls.unknown_values.clear()
+
+    @classmethod
+    def prefetch(cls, expressions: Iterable['Exprable']) -> None:
+        """Make sure that the values of the given expressions are known.
+
+        Evaluate all the given expressions whose value is not known yet,
+        together with any other expression that is waiting for evaluation,
+        in a single compilation. Call this with every expression that
+        a generator may need before asking for any value, to avoid
+        compiling a C program several times.
+        """
+        for expr in expressions:
+            if isinstance(expr, Expr):
+                if expr.value_if_known is None:
+                    cls.unknown_values.add(cls.normalize(expr.string))
+            elif isinstance(expr, str):
+                cls.unknown_values.add(cls.normalize(expr))
+        cls.update_cache()
 
     @staticmethod
     def normalize(string: str) -> str:
@@ -80,10 +140,12 @@ class Expr:
         """
         return re.sub(r'\s+', r'', string)
 
+    NUMERAL_RE = re.compile(r'([0-9]+|0x[0-9a-f]+)\Z', re.I)
+
     def value(self) -> int:
         """Return the numerical value of the expression."""
         if self.value_if_known is None:
-            if re.match(r'([0-9]+|0x[0-9a-f]+)\Z', self.string, re.I):
+            if self.NUMERAL_RE.match(self.string):
                 return int(self.string, 0)
             normalized = self.normalize(self.string)
             if normalized not in self.value_cache:
@@ -91,6 +153,25 @@ class Expr:
             self.value_if_known = self.value_cache[normalized]
         return self.value_if_known
 
+    @classmethod
+    def values(cls, exprs: Iterable['Expr']) -> List[int]:
+        """Return the numerical values of the given expressions.
+
+        This evaluates all the expressions whose value is not known yet
+        in a single batch.
+        """
+        exprs = list(exprs)
+        missing = set()
+        for expr in exprs:
+            if expr.value_if_known is None and \
+               not cls.NUMERAL_RE.match(expr.string):
+                normalized = cls.normalize(expr.string)
+                if normalized not in cls.value_cache:
+                    missing.add(normalized)
+        if missing:
+            cls.prefetch(missing)
+        return [expr.value() for expr in exprs]
+
 Exprable = Union[str, int, Expr]
 """Something that can be converted to a C expression with a known numerical value."""
 
@@ -182,6 +263,67 @@ class Key:
         """
         return self.bytes().hex()
 
+    # The header of the representation in version 0 of the storage format,
+    # up to the key material: magic, version, lifetime, type, bits, usage,
+    # alg, alg2, length of the material. See `bytes()`.
+    HEADER_V0 = struct.Struct('<{}sLLHHLLLL'.format(len(MAGIC)))
+
+    @classmethod
+    def pack_all(cls,
+                 keys: Sequence['Key']) -> Tuple[bytearray, List[Tuple[int, int]]]:
+        """Pack the representation of all the given keys into one buffer.
+
+        Return the buffer and the ``(start, end)`` offsets of the
+        representation of each key in it. The representation of each key
+        is the same as `bytes()`. All the expressions are evaluated in one
+        batch (see `Expr.values()`).
+        """
+        for key in keys:
+            if key.version != 0:
+                raise NotImplementedError
+        values = Expr.values(expr
+                             for key in keys
+                             for expr in (key.lifetime, key.type, key.usage,
+                                          key.alg, key.alg2))
+        header_size = cls.HEADER_V0.size
+        buffer = bytearray(sum(header_size + len(key.material) for key in keys))
+        offsets = []
+        start = 0
+        for n, key in enumerate(keys):
+            lifetime, type_, usage, alg, alg2 = values[5 * n:5 * n + 5]
+            cls.HEADER_V0.pack_into(buffer, start,
+                                    cls.MAGIC, key.version,
+                                    lifetime, type_, key.bits,
+                                    usage, alg, alg2,
+                                    len(key.material))
+            end = start + header_size + len(key.material)
+            buffer[start + header_size:end] = key.material
+            offsets.append((start, end))
+            start = end
+        return buffer, offsets
+
+    @classmethod
+    def bytes_of_all(cls, keys: Sequence['Key']) -> List[memoryview]:
+        """Return the representation of each of the given keys.
+
+        This is equivalent to calling `bytes()` on each key, but faster
+        for many keys. The results are views into a shared buffer.
+        """
+        buffer, offsets = cls.pack_all(keys)
+        view = memoryview(buffer)
+        return [view[start:end] for start, end in offsets]
+
+    @classmethod
+    def hex_of_all(cls, keys: Sequence['Key']) -> List[str]:
+        """Return the representation of each of the given keys in hexadecimal.
+
+        This is equivalent to calling `hex()` on each key, but faster
+        for many keys.
+        """
+        buffer, offsets = cls.pack_all(keys)
+        hex_buffer = buffer.hex()
+        return [hex_buffer[2 * start:2 * end] for start, end in offsets]
+
     def location_value(self) -> int:
         """The numerical value of the location encoded in the key's lifetime."""
         return self.lifetime.value() >> 8
@@ -219,3 +361,23 @@ class TestKey(unittest.TestCase):
         expected_hex = '505341004b455900000000000100000001100800000000000000000000000000010000002a'
         self.assertEqual(key.bytes(), bytes.fromhex(expected_hex))
         self.assertEqual(key.hex(), expected_hex)
+
+    def test_bulk(self):
+        keys = [Key(version=0,
+                    id=1, lifetime=0x00000001,
+                    type=0x2400, bits=128,
+                    usage=0x00000300, alg=0x05500200, alg2=0x04c01000,
+                    material=b'@ABCDEFGHIJKLMNO'),
+                Key(lifetime=0x00000001,
+                    type=0x1001, bits=8,
+                    usage=0, alg=0, alg2=0,
+                    material=b''),
+                Key(lifetime='1',
+                    type='0x1001', bits=16,
+                    usage=0, alg=0, alg2=0,
+                    material=b'\x2a\x2b')]
+        self.assertEqual([bytes(b) for b in Key.bytes_of_all(keys)],
+                         [key.bytes() for key in keys])
+        self.assertEqual(Key.hex_of_all(keys),
+                         [key.hex() for key in keys])
+        self.assertEqual(Key.hex_of_all([]), [])
@@ -28,34 +28,41 @@ def read_implemented_dependencies(acc: Set[str], filename: str) -> None:
             for symbol in re.findall(r'\bPSA_WANT_\w+\b', line):
                 acc.add(symbol)
 
+def implemented_dependencies_files() -> List[str]:
+    """List the configuration headers that define the implemented PSA_WANT symbols."""
+    # Temporary, while Mbed TLS does not just rely on the TF-PSA-Crypto
+    # build system to build its crypto library. When it does, the first
+    # case can just be removed.
+
+    if build_tree.looks_like_root('.'):
+        if build_tree.looks_like_mbedtls_root('.') and \
+           (not build_tree.is_mbedtls_3_6()):
+            include_dir = 'tf-psa-crypto/include'
+        else:
+            include_dir = 'include'
+
+    paths = []
+    for filename in [
+            'psa/crypto_config.h',
+            'psa/crypto_adjust_config_synonyms.h',
+            'tf-psa-crypto/private/crypto_adjust_config_synonyms.h',
+    ]:
+        path = os.path.join(build_tree.guess_project_root(),
+                            include_dir,
+                            filename)
+        if os.path.exists(path):
+            paths.append(path)
+    return paths
+
 _implemented_dependencies = None #type: Optional[FrozenSet[str]] #pylint: disable=invalid-name
 
 def find_dependencies_not_implemented(dependencies: List[str]) -> List[str]:
     """List the dependencies that are not implemented."""
     global _implemented_dependencies #pylint: disable=global-statement,invalid-name
     if _implemented_dependencies is None:
-        # Temporary, while Mbed TLS does not just rely on the TF-PSA-Crypto
-        # build system to build its crypto library. When it does, the first
-        # case can just be removed.
-
-        if build_tree.looks_like_root('.'):
-            if build_tree.looks_like_mbedtls_root('.') and \
-               (not build_tree.is_mbedtls_3_6()):
-                include_dir = 'tf-psa-crypto/include'
-            else:
-                include_dir = 'include'
-
         acc = set() #type: Set[str]
-        for filename in [
-                'psa/crypto_config.h',
-                'psa/crypto_adjust_config_synonyms.h',
-                'tf-psa-crypto/private/crypto_adjust_config_synonyms.h',
-        ]:
-            path = os.path.join(build_tree.guess_project_root(),
-                                include_dir,
-                                filename)
-            if os.path.exists(path):
-                read_implemented_dependencies(acc, path)
+        for path in implemented_dependencies_files():
+            read_implemented_dependencies(acc, path)
         _implemented_dependencies = frozenset(acc)
     return [dep
             for dep in dependencies
@@ -0,0 +1,91 @@
+"""Compare generated content with an existing file without materializing it.
+"""
+
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+#
+
+from typing import IO, Optional, Union
+
+
+class ContentMismatch(Exception):
+    """Raised by a StreamComparator in stop_early mode on the first difference."""
+
+
+class StreamComparator:
+    """A writable stream that compares what is written to it with a file.
+
+    Each chunk that is written is compared with the next chunk of the same
+    size in the reference file, so neither the new content nor the old
+    content is ever held in memory as a whole.
+
+    ```
+    with StreamComparator(filename) as comparator:
+        generate(comparator)
+        same = comparator.matches()
+    ```
+
+    If `stop_early` is true, `write` raises `ContentMismatch` as soon
+    as a difference is detected, which lets the caller abort generation.
+    """
+
+    def __init__(self, filename: str,
+                 binary: bool = False,
+                 stop_early: bool = False) -> None:
+        self.filename = filename
+        self.stop_early = stop_early
+        if binary:
+            self.file = open(filename, 'rb') #type: Optional[IO]
+        else:
+            self.file = open(filename, 'r', encoding='utf-8')
+        self.identical = True
+
+    def write(self, data: Union[str, bytes]) -> int:
+        """Compare `data` with the next chunk of the reference file."""
+        if self.identical:
+            assert self.file is not None
+            if self.file.read(len(data)) != data:
+                self.identical = False
+        if not self.identical and self.stop_early:
+            raise ContentMismatch(self.filename)
+        return len(data)
+
+    def matches(self) -> bool:
+        """Whether everything written so far is exactly the whole reference file.
+
+        Call this after writing all the content.
+        """
+        if not self.identical:
+            return False
+        assert self.file is not None
+        return not self.file.read(1)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> 'StreamComparator':
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.close()
+
+
+def compare_files(filename1: str, filename2: str,
+                  chunk_size: int = 65536) -> bool:
+    """Whether the two given files have identical content.
+
+    Stop reading at the first difference.
+    """
+    with StreamComparator(filename1, binary=True, stop_early=True) as comparator, \
+         open(filename2, 'rb') as input_file:
+        try:
+            while True:
+                chunk = input_file.read(chunk_size)
+                if not chunk:
+                    break
+                comparator.write(chunk)
+        except ContentMismatch:
+            return False
+        return comparator.matches()
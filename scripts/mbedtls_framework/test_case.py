@@ -6,13 +6,17 @@
 #
 
 import binascii
+import functools
+import hashlib
 import os
 import sys
-from typing import Iterable, List, Optional
+import tempfile
+from typing import IO, Iterable, List, Optional
 from enum import Enum
 
 from . import build_tree
 from . import psa_information
+from . import stream_compare
 from . import typing_util
 
 HASHES_3_6 = {
@@ -100,10 +104,10 @@ class TestCase:
         if self.function is None:
             raise MissingFunction
 
-    def write(self, out: typing_util.Writable) -> None:
-        """Write the .data file paragraph for this test case.
+    def render(self) -> str:
+        """Return the .data file paragraph for this test case.
 
-        The output starts and ends with a single newline character. If the
+        The paragraph starts and ends with a single newline character. If the
         surrounding code writes lines (consisting of non-newline characters
         and a final newline), you will end up with a blank line before, but
         not after the test case.
@@ -111,45 +115,226 @@ class TestCase:
         self.check_completeness()
         assert self.description is not None # guide mypy
         assert self.function is not None # guide mypy
-        out.write('\n')
+        lines = ['']
         for line in self.comments:
-            out.write('# ' + line + '\n')
+            lines.append('# ' + line)
         prefix = ''
         if self.skip_reasons:
             prefix = '## '
             for reason in self.skip_reasons:
-                out.write('## # skipped because: ' + reason + '\n')
-        out.write(prefix + self.description + '\n')
+                lines.append('## # skipped because: ' + reason)
+        lines.append(prefix + self.description)
         dependencies = self.get_dependencies()
         if dependencies:
-            out.write(prefix + 'depends_on:' +
-                      ':'.join(dependencies) + '\n')
-        out.write(prefix + self.function + ':' +
-                  ':'.join(self.arguments) + '\n')
+            lines.append(prefix + 'depends_on:' + ':'.join(dependencies))
+        lines.append(prefix + self.function + ':' + ':'.join(self.arguments))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write(self, out: typing_util.Writable) -> None:
+        """Write the .data file paragraph for this test case.
+
+        See `render()` for the format.
+        """
+        out.write(self.render())
+
+# Size of the chunks in which write_data_file() writes its output.
+DATA_CHUNK_SIZE = 1 << 16
+
+class ChunkedWriter:
+    """A writable stream that passes what is written to it in large chunks.
+
+    Writing many short strings to a file object is slow. This class
+    accumulates the strings and writes them to the underlying stream
+    `out` once they add up to at least `chunk_size` characters.
+    Call `flush()` at the end to write the remaining content.
+
+    If `hash_content` is true, also compute the SHA-256 hash of the UTF-8
+    encoding of the content. See `hexdigest()`.
+    """
+
+    def __init__(self, out: typing_util.Writable,
+                 chunk_size: int = DATA_CHUNK_SIZE,
+                 hash_content: bool = False) -> None:
+        self.out = out
+        self.chunk_size = chunk_size
+        self.hasher = hashlib.sha256() if hash_content else None
+        self.pending = [] #type: List[str]
+        self.pending_size = 0
+
+    def write(self, text: str) -> int:
+        self.pending.append(text)
+        self.pending_size += len(text)
+        if self.pending_size >= self.chunk_size:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        """Write out the content that has been buffered so far."""
+        if not self.pending:
+            return
+        chunk = ''.join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        if self.hasher is not None:
+            self.hasher.update(chunk.encode('utf-8'))
+        self.out.write(chunk)
+
+    def hexdigest(self) -> str:
+        """The SHA-256 hash of the content written so far, in hex.
+
+        This is the same as `persistent_cache.file_hash()` of a file
+        containing the content. Only available with ``hash_content=True``.
+        """
+        assert self.hasher is not None
+        self.flush()
+        return self.hasher.hexdigest()
 
 def write_data_stream(out,
                       test_cases: Iterable[TestCase],
-                      caller: Optional[str] = None) -> None:
-    """Write the test cases to the specified output stream."""
+                      caller: Optional[str] = None,
+                      chunk_size: int = 0,
+                      hash_content: bool = False) -> Optional[str]:
+    """Write the test cases to the specified output stream.
+
+    If `chunk_size` is positive, pass the content to `out` in chunks of at
+    least this many characters (see `ChunkedWriter`). Otherwise write each
+    test case separately.
+
+    If `hash_content` is true, return the SHA-256 hash of the content in hex.
+    Otherwise return None.
+    """
+    if chunk_size > 0 or hash_content:
+        writer = ChunkedWriter(out, chunk_size, hash_content)
+        write_data_stream(writer, test_cases, caller)
+        writer.flush()
+        return writer.hexdigest() if hash_content else None
     if caller is None:
         caller = os.path.basename(sys.argv[0])
     out.write('# Automatically generated by {}. Do not edit!\n'
               .format(caller))
     for tc in test_cases:
-        tc.write(out)
+        out.write(tc.render())
     out.write('\n# End of automatically generated file.\n')
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _new_file_mode() -> int:
+    """The permissions of a newly created file, according to the umask."""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+class _FileReplacer:
+    """A writable stream whose content replaces a file when committed.
+
+    The content is written to a temporary file next to the target file,
+    which atomically replaces the target file in `commit()`, so readers
+    never see a partially written file. The temporary file name is unique,
+    so that concurrent writers of the same file don't interfere with each
+    other.
+
+    If `only_if_changed` is true and the target file exists, the content
+    is compared with it as it is written, and nothing is written to disk
+    as long as it matches. On the first difference, the temporary file is
+    created with the part of the old content that matched, and the rest
+    of the content goes there.
+    """
+
+    def __init__(self, filename: str, only_if_changed: bool = False) -> None:
+        self.filename = filename
+        self.comparator = None #type: Optional[stream_compare.StreamComparator]
+        if only_if_changed and os.path.exists(filename):
+            self.comparator = stream_compare.StreamComparator(filename)
+        self.matched_size = 0
+        self.out = None #type: Optional[IO[str]]
+        self.temp_name = None #type: Optional[str]
+
+    def _start_output(self) -> None:
+        fd, self.temp_name = tempfile.mkstemp(
+            dir=os.path.dirname(self.filename) or '.',
+            prefix=os.path.basename(self.filename) + '.',
+            suffix='.new')
+        self.out = os.fdopen(fd, 'w', encoding='utf-8')
+        if self.comparator is not None:
+            self.comparator.close()
+            with open(self.filename, 'r', encoding='utf-8') as old:
+                while self.matched_size > 0:
+                    chunk = old.read(min(self.matched_size, DATA_CHUNK_SIZE))
+                    self.out.write(chunk)
+                    self.matched_size -= len(chunk)
+
+    def write(self, text: str) -> int:
+        if self.out is None:
+            if self.comparator is not None:
+                self.comparator.write(text)
+                if self.comparator.identical:
+                    self.matched_size += len(text)
+                    return len(text)
+            self._start_output()
+            assert self.out is not None # guide mypy
+        return self.out.write(text)
+
+    def commit(self) -> bool:
+        """Replace the target file, unless it already has the new content.
+
+        Return true if the target file was replaced.
+        """
+        if self.out is None:
+            if self.comparator is not None and self.comparator.matches():
+                self.comparator.close()
+                return False
+            self._start_output()
+            assert self.out is not None # guide mypy
+        self.out.close()
+        assert self.temp_name is not None # guide mypy
+        # mkstemp() creates the file with restrictive permissions.
+        os.chmod(self.temp_name, _new_file_mode())
+        os.replace(self.temp_name, self.filename)
+        self.temp_name = None
+        return True
+
+    def discard(self) -> None:
+        """Clean up after a failure."""
+        if self.comparator is not None:
+            self.comparator.close()
+        if self.out is not None:
+            self.out.close()
+        if self.temp_name is not None:
+            try:
+                os.remove(self.temp_name)
+            except FileNotFoundError:
+                pass
+            self.temp_name = None
 
 def write_data_file(filename: str,
                     test_cases: Iterable[TestCase],
-                    caller: Optional[str] = None) -> None:
+                    caller: Optional[str] = None,
+                    only_if_changed: bool = False) -> str:
     """Write the test cases to the specified file.
 
-    If the file already exists, it is overwritten.
+    If the file already exists, it is overwritten. The content is first
+    written to a temporary file which then atomically replaces the
+    original file, so readers never see a partially written file.
+
+    If `only_if_changed` is true and the file already has the expected
+    content, leave it alone, so that its modification time doesn't change
+    and build tools don't consider it as modified. The content is compared
+    while it is generated, and the file is only written if it differs.
+
+    Return the SHA-256 hash of the content in hex.
     """
-    tempfile = filename + '.new'
-    with open(tempfile, 'w') as out:
-        write_data_stream(out, test_cases, caller)
-    os.replace(tempfile, filename)
+    replacer = _FileReplacer(filename, only_if_changed)
+    try:
+        digest = write_data_stream(replacer, test_cases, caller,
+                                   chunk_size=DATA_CHUNK_SIZE,
+                                   hash_content=True)
+        replacer.commit()
+    except BaseException:
+        replacer.discard()
+        raise
+    assert digest is not None # guide mypy
+    return digest
 
 def psa_or_3_6_feature_macro(psa_name: str,
                              domain_3_6: Domain36) -> str:
@@ -11,20 +11,46 @@ These are used both by generate_psa_tests.py and generate_bignum_tests.py.
 #
 
 import argparse
-import io
+import ast
+import concurrent.futures
+import hashlib
+import heapq
+import importlib.util
 import os
 import posixpath
 import re
 import inspect
+import sys
+import weakref
 
 from abc import ABCMeta, abstractmethod
-from typing import Callable, Dict, Iterable, Iterator, List, Type, TypeVar
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type, \
+    TypeVar
 
 from . import build_tree
+from . import persistent_cache
+from . import stream_compare
 from . import test_case
 
 T = TypeVar('T') #pylint: disable=invalid-name
 
+# The directory containing the mbedtls_framework package.
+FRAMEWORK_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_file_hash_cache = {} #type: Dict[str, str]
+
+def file_hash(filename: str) -> str:
+    """Return `persistent_cache.file_hash(filename)`, with caching.
+
+    The result is cached for the lifetime of the process. Only use this for
+    input files, which don't change while generating.
+    """
+    key = os.path.abspath(filename)
+    if key not in _file_hash_cache:
+        _file_hash_cache[key] = persistent_cache.file_hash(filename)
+    return _file_hash_cache[key]
+
 
 class BaseTest(metaclass=ABCMeta):
     """Base class for test case generation.
@@ -52,6 +78,19 @@ class BaseTest(metaclass=ABCMeta):
         cls.count += 1
         return super().__new__(cls)
 
+    @classmethod
+    def reset_generation_state(cls) -> None:
+        """Reset the class-level state of this class and all its descendants.
+
+        This matters when a generation script runs more than once in the
+        same process: the generated test cases, including their numbering,
+        must not depend on earlier runs. Subclasses that keep other state in
+        class attributes while generating test cases should extend this.
+        """
+        cls.count = 0
+        for subclass in cls.__subclasses__():
+            subclass.reset_generation_state()
+
     @abstractmethod
     def arguments(self) -> List[str]:
         """Get the list of arguments for the test case.
@@ -105,6 +144,51 @@ class BaseTest(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    @classmethod
+    def generation_shards(cls) -> List[Any]:
+        """Split the generation of the test cases of this class into parts.
+
+        Return a list of picklable objects, each of which can be passed to
+        `generate_shard()` independently, possibly in another process.
+        Return an empty list (the default) if the test cases can only be
+        generated by `generate_function_tests()`.
+        """
+        return []
+
+    @classmethod
+    def generate_shard(cls, shard: Any,
+                       base_count: int) -> Tuple[List[Tuple[int, test_case.TestCase]],
+                                                 int]:
+        """Generate the test cases for one part of `generation_shards()`.
+
+        `base_count` is the value of `count` before generating any test case
+        of this class. Return a list of the test cases with their position
+        in the output of `generate_function_tests()`, in increasing order,
+        and the number of test objects that `generate_function_tests()`
+        creates in total.
+
+        Only classes whose `generation_shards()` is not empty need to
+        implement this.
+        """
+        raise TypeError('{} is not sharded'.format(cls.__name__))
+
+    @classmethod
+    def merge_shards(
+            cls,
+            base_count: int,
+            shard_results: List[Tuple[List[Tuple[int, test_case.TestCase]], int]]
+    ) -> Iterator[test_case.TestCase]:
+        """Combine the results of `generate_shard()` for all the shards.
+
+        The result is the same as what `generate_function_tests()` yields,
+        and `count` is left with the same value.
+        """
+        cls.count = base_count + max((size for _, size in shard_results),
+                                     default=0)
+        for _position, tc in heapq.merge(*(cases for cases, _ in shard_results),
+                                         key=lambda item: item[0]):
+            yield tc
+
 
 class BaseTarget:
     #pylint: disable=too-few-public-methods
@@ -137,6 +221,175 @@ class BaseTarget:
         for subclass in sorted(cls.__subclasses__(), key=lambda c: c.__name__):
             yield from subclass.generate_tests()
 
+    @classmethod
+    def test_classes(cls) -> Iterator[Type[BaseTest]]:
+        """Enumerate the test classes in the order used by `generate_tests()`."""
+        if issubclass(cls, BaseTest) and not inspect.isabstract(cls):
+            yield cls
+        for subclass in sorted(cls.__subclasses__(), key=lambda c: c.__name__):
+            yield from subclass.test_classes()
+
+    @classmethod
+    def generate_tests_in_parallel(cls, jobs: int) -> Iterator[test_case.TestCase]:
+        """Generate the same test cases as `generate_tests()` in `jobs` processes.
+
+        The shards of the classes that define `generation_shards()` are
+        generated in worker processes. Meanwhile, the test cases of the
+        other classes are generated in this process.
+        """
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            submitted = []
+            for test_class in cls.test_classes():
+                base_count = test_class.count
+                futures = [executor.submit(_generate_shard_in_worker,
+                                           test_class, shard, base_count)
+                           for shard in test_class.generation_shards()]
+                submitted.append((test_class, base_count, futures))
+            for test_class, base_count, futures in submitted:
+                if futures:
+                    yield from test_class.merge_shards(
+                        base_count, [future.result() for future in futures])
+                else:
+                    yield from test_class.generate_function_tests()
+
+def _generate_shard_in_worker(
+        test_class: Type[BaseTest],
+        shard: Any,
+        base_count: int
+) -> Tuple[List[Tuple[int, test_case.TestCase]], int]:
+    return test_class.generate_shard(shard, base_count)
+
+
+def _modules_reachable_from(module: ModuleType) -> Set[str]:
+    """Return the names of the modules that the given module imports, transitively."""
+    reachable = {module.__name__}
+    queue = [module]
+    while queue:
+        for value in list(vars(queue.pop()).values()):
+            if isinstance(value, ModuleType) and value.__name__ not in reachable:
+                reachable.add(value.__name__)
+                queue.append(value)
+    return reachable
+
+_imports_cache = {} #type: Dict[str, Set[str]]
+
+def _imported_module_names(module: ModuleType) -> Set[str]:
+    """Return the names of the modules that the source of the given module imports.
+
+    Unlike `_modules_reachable_from`, this also finds the modules that
+    are only imported with ``from module import name``.
+    """
+    filename = getattr(module, '__file__', None)
+    if not filename or not filename.endswith('.py'):
+        return set()
+    if filename not in _imports_cache:
+        with open(filename, encoding='utf-8') as input_file:
+            tree = ast.parse(input_file.read(), filename)
+        package = getattr(module, '__package__', None) or ''
+        names = set() #type: Set[str]
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ''
+                if node.level:
+                    try:
+                        base = importlib.util.resolve_name('.' * node.level + base,
+                                                           package)
+                    except (ImportError, ValueError):
+                        continue
+                names.add(base)
+                # "from package import module"
+                names.update(base + '.' + alias.name for alias in node.names)
+        _imports_cache[filename] = names
+    return _imports_cache[filename]
+
+def _source_directories() -> List[str]:
+    """Return the directories whose Python modules generated files can depend on.
+
+    These are the directory containing the mbedtls_framework package and
+    the directory containing the main script.
+    """
+    directories = [os.path.dirname(FRAMEWORK_PACKAGE_DIR)]
+    main_file = getattr(sys.modules['__main__'], '__file__', None)
+    if main_file:
+        directories.append(os.path.dirname(os.path.abspath(main_file)))
+    return directories
+
+def _module_source(module: ModuleType, directories: List[str]) -> Optional[str]:
+    """Return the absolute path to the source of the given module.
+
+    Return None if the module is not a Python source file located in one of
+    the given directories.
+    """
+    filename = getattr(module, '__file__', None)
+    if not filename or not filename.endswith('.py'):
+        return None
+    filename = os.path.abspath(filename)
+    if not any(filename.startswith(directory + os.sep)
+               for directory in directories):
+        return None
+    return filename
+
+def _imported_modules(roots: Iterable[ModuleType],
+                      directories: List[str]) -> List[ModuleType]:
+    """Return the given modules and the loaded modules that they import, transitively.
+
+    Only the modules whose source is in one of the given directories are
+    included and followed. In particular, the standard library is skipped
+    without parsing its source.
+    """
+    found = {} #type: Dict[str, ModuleType]
+    queue = list(roots)
+    while queue:
+        module = queue.pop()
+        if module.__name__ in found or \
+           _module_source(module, directories) is None:
+            continue
+        found[module.__name__] = module
+        for name in _imported_module_names(module):
+            imported = sys.modules.get(name)
+            if imported is not None and imported.__name__ not in found:
+                queue.append(imported)
+    return list(found.values())
+
+# The file target classes that were defined by generation scripts that
+# previously ran in this process (see `mark_earlier_targets`).
+_earlier_targets = weakref.WeakSet() #type: weakref.WeakSet[Type[BaseTarget]]
+
+def mark_earlier_targets() -> None:
+    """Mark the existing file target classes as belonging to an earlier script.
+
+    Call this after running a generation script in the current process
+    (see `generated_files.run_python_in_process`), so that the scripts
+    that run afterwards don't generate its targets.
+    """
+    _earlier_targets.update(BaseTarget.__subclasses__())
+
+def target_classes() -> List[Type[BaseTarget]]:
+    """Return the file target classes of the running script.
+
+    These are the direct subclasses of BaseTarget. The classes marked by
+    `mark_earlier_targets` are only included if they are defined in the
+    main module or in modules that it imports.
+    """
+    main_module = sys.modules['__main__']
+    reachable = None #type: Optional[Set[str]]
+    classes = []
+    for subclass in BaseTarget.__subclasses__():
+        if subclass in _earlier_targets:
+            if reachable is None:
+                reachable = _modules_reachable_from(main_module)
+            if subclass.__module__ not in reachable:
+                continue
+            if subclass.__module__ == '__main__' and \
+               getattr(main_module, subclass.__name__, None) is not subclass:
+                # A class from another script that was previously
+                # executed as the main module.
+                continue
+        classes.append(subclass)
+    return classes
+
 
 class TestGenerator:
     """Generate test cases and write to data files."""
@@ -147,13 +400,26 @@ class TestGenerator:
 
     def __init__(self, options) -> None:
         self.test_suite_directory = options.directory
+        # If true, is_up_to_date() compares the full content of the target
+        # instead of only its dependency stamp.
+        self.strict = getattr(options, 'strict', False)
+        # Number of processes that a single target may use. run_targets()
+        # raises this when it processes targets one at a time.
+        self.jobs_per_target = 1
         # Update `targets` with an entry for each child class of BaseTarget.
         # Each entry represents a file generated by the BaseTarget framework,
         # and enables generating the .data files using the CLI.
-        self.targets.update({
-            subclass.target_basename: subclass.generate_tests
-            for subclass in BaseTarget.__subclasses__()
+        # Work on a copy, so that the class attribute is not modified.
+        self.targets = dict(self.targets)
+        BaseTest.reset_generation_state()
+        self.target_classes = {
+            subclass.target_basename: subclass
+            for subclass in target_classes()
             if subclass.target_basename
+        } #type: Dict[str, Type[BaseTarget]]
+        self.targets.update({
+            name: subclass.generate_tests
+            for name, subclass in self.target_classes.items()
         })
 
     def filename_for(self, basename: str) -> str:
@@ -165,33 +431,211 @@ class TestGenerator:
         """Write the test cases to a .data file.
 
         The output file is ``basename + '.data'`` in the test suite directory.
+        If it already has the expected content, it is not modified, so that
+        build tools don't rebuild the corresponding test suite.
         """
         filename = self.filename_for(basename)
-        test_case.write_data_file(filename, test_cases)
+        digest = test_case.write_data_file(filename, test_cases,
+                                           only_if_changed=True)
+        # The stamp is only useful if it can be recorded, and computing it
+        # is not free, so skip it if the persistent cache is disabled.
+        if persistent_cache.cache_directory() is not None:
+            self.record_stamp(filename, self.dependency_stamp(basename), digest)
+
+    def target_modules(self, name: str) -> List[ModuleType]:
+        """List the Python modules that the given target is generated by.
+
+        For a target defined by a BaseTarget subclass, these are the modules
+        that define the target class, its test classes and their base
+        classes. For other targets, this is the main script. In both cases,
+        this includes the modules that they import, transitively. Only the
+        modules that are part of the framework scripts or located next to
+        the main script are listed.
+        """
+        target_class = self.target_classes.get(name)
+        if target_class is not None and \
+           self.targets[name] == target_class.generate_tests:
+            classes = [target_class] + list(target_class.test_classes())
+            roots = {sys.modules[klass.__module__]
+                     for test_class in classes
+                     for klass in test_class.__mro__
+                     if klass.__module__ in sys.modules}
+        else:
+            roots = {sys.modules['__main__']}
+        return _imported_modules(roots, _source_directories())
+
+    def dependency_files(self, name: str) -> List[str]:
+        """List the files that the content of the given target depends on.
+
+        This includes the Python modules of the generator and any input
+        files that it parses. The default is the source files of the
+        modules returned by `target_modules`. Override this method to add
+        input files such as headers.
+        """
+        directories = _source_directories()
+        files = set()
+        for module in self.target_modules(name):
+            filename = _module_source(module, directories)
+            if filename is not None:
+                files.add(filename)
+        return sorted(files)
+
+    def dependency_stamp(self, name: str) -> str:
+        """Return a stamp identifying the inputs of the given target.
+
+        The stamp is a hash of the target name and of the content of each of
+        the files returned by `dependency_files`. It is recorded when the
+        target is generated (see `record_stamp`), which allows
+        `is_up_to_date` to detect outdated targets without generating them.
+        """
+        hasher = hashlib.sha256(name.encode('utf-8'))
+        for filename in self.dependency_files(name):
+            hasher.update(b'\0' + file_hash(filename).encode('ascii'))
+        return hasher.hexdigest()
+
+    # Kind of the persistent cache entries that record dependency stamps.
+    STAMP_CACHE_KIND = 'data_stamp'
+
+    @staticmethod
+    def _stamp_key(filename: str) -> str:
+        return hashlib.sha256(os.path.abspath(filename).encode('utf-8')).hexdigest()
+
+    def record_stamp(self, filename: str, stamp: str, digest: str) -> None:
+        """Record that `filename` was generated from the inputs identified by `stamp`.
+
+        `digest` is the `persistent_cache.file_hash` of the generated file. The record
+        is kept outside of the generated file, in the persistent cache (see
+        `persistent_cache`), so that the content of the generated file
+        only depends on the test cases.
+        """
+        #pylint: disable=no-self-use
+        persistent_cache.save_json(self.STAMP_CACHE_KIND, self._stamp_key(filename),
+                                   {'stamp': stamp, 'content': digest})
+
+    def recorded_stamp_matches(self, name: str) -> Optional[bool]:
+        """Check the stamp recorded by `record_stamp` for the given target.
+
+        Return None if no stamp is recorded. Otherwise, return whether the
+        recorded stamp is the current `dependency_stamp` and the file hasn't
+        changed since.
+        """
+        filename = self.filename_for(name)
+        record = persistent_cache.load_json(self.STAMP_CACHE_KIND,
+                                            self._stamp_key(filename))
+        if not isinstance(record, dict):
+            return None
+        return (record.get('stamp') == self.dependency_stamp(name) and
+                record.get('content') == persistent_cache.file_hash(filename))
+
+    def target_test_cases(self, name: str) -> Iterable[test_case.TestCase]:
+        """Return the test cases for the given target.
+
+        For target callables which require arguments, override this method
+        and pass these arguments (see PSATestGenerator).
+
+        Targets that are defined by a BaseTarget subclass are generated
+        with `BaseTarget.generate_tests_in_parallel()` if more than one
+        process is allowed.
+        """
+        target_class = self.target_classes.get(name)
+        if target_class is not None and self.jobs_per_target > 1 and \
+           self.targets[name] == target_class.generate_tests:
+            return target_class.generate_tests_in_parallel(self.jobs_per_target)
+        return self.targets[name]()
 
     def generate_target(self, name: str, *target_args) -> None:
         """Generate cases and write to data file for a target.
 
-        For target callables which require arguments, override this function
-        and pass these arguments using super() (see PSATestGenerator).
+        For target callables which require arguments, override
+        `target_test_cases`. Overriding this function and passing
+        the arguments using super() is also supported.
         """
-        test_cases = self.targets[name](*target_args)
+        if target_args:
+            test_cases = self.targets[name](*target_args)
+        else:
+            test_cases = self.target_test_cases(name)
         self.write_test_data_file(name, test_cases)
 
     def is_up_to_date(self, target) -> bool:
-        """Check if the given target already has the expected content."""
+        """Check if the given target already has the expected content.
+
+        By default, only compare the dependency stamp recorded when the file
+        was generated with the expected one. If `self.strict` is true, or if
+        no stamp has been recorded, regenerate the content and compare it
+        with the file.
+        """
         filename = self.filename_for(target)
         if not os.path.exists(filename):
             return False
-        test_cases = self.targets[target]()
-        out = io.StringIO()
-        test_case.write_data_stream(out, test_cases)
-        out.seek(0)
-        new_content = out.read()
-        out.close()
-        with open(filename) as current_file:
-            old_content = current_file.read()
-        return new_content == old_content
+        if not self.strict:
+            matches = self.recorded_stamp_matches(target)
+            if matches is not None:
+                return matches
+        test_cases = self.target_test_cases(target)
+        with stream_compare.StreamComparator(filename, stop_early=True) as out:
+            try:
+                test_case.write_data_stream(out, test_cases,
+                                            chunk_size=test_case.DATA_CHUNK_SIZE)
+            except stream_compare.ContentMismatch:
+                return False
+            return out.matches()
+
+
+# The generator object used by each worker process in parallel mode.
+# Targets are often lambdas or closures, which can't be sent to another
+# process, so each worker builds its own generator once and then receives
+# target names.
+_worker_generator = None #type: Optional[TestGenerator] #pylint: disable=invalid-name
+
+def _init_worker(generator_class: Type[TestGenerator], options) -> None:
+    global _worker_generator #pylint: disable=global-statement,invalid-name
+    _worker_generator = generator_class(options)
+
+def _generate_target_in_worker(name: str) -> None:
+    assert _worker_generator is not None
+    _worker_generator.generate_target(name)
+
+def _is_up_to_date_in_worker(name: str) -> bool:
+    assert _worker_generator is not None
+    return _worker_generator.is_up_to_date(name)
+
+def run_targets(generator: TestGenerator,
+                generator_class: Type[TestGenerator],
+                options,
+                targets: List[str]) -> None:
+    """Generate or check the given targets, possibly in parallel.
+
+    With ``options.jobs`` greater than 1, the targets are processed in a
+    pool of worker processes. Each data file is written by a single worker
+    and replaced atomically, and the output of ``--list-outdated`` is
+    printed in the order of ``targets`` regardless of completion order.
+    Otherwise, the targets are processed one at a time, and each one may
+    use up to ``options.jobs`` processes (see `TestGenerator.jobs_per_target`).
+    """
+    jobs = min(options.jobs, len(targets))
+    if jobs <= 1:
+        # Let a lone target use all the allowed processes, if it can.
+        generator.jobs_per_target = max(options.jobs, 1)
+        for target in targets:
+            if options.list_outdated:
+                if not generator.is_up_to_date(target):
+                    print(generator.filename_for(target))
+            else:
+                generator.generate_target(target)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(generator_class, options)) as executor:
+        if options.list_outdated:
+            # executor.map returns results in the order of the inputs.
+            up_to_date = executor.map(_is_up_to_date_in_worker, targets)
+            for target, ok in zip(targets, up_to_date):
+                if not ok:
+                    print(generator.filename_for(target))
+        else:
+            for _ in executor.map(_generate_target_in_worker, targets):
+                pass
 
 
 def main(args, description: str, generator_class: Type[TestGenerator] = TestGenerator):
@@ -204,12 +648,18 @@ def main(args, description: str, generator_class: Type[TestGenerator] = TestGene
     parser.add_argument('--list-outdated', action='store_true',
                         help=('List outdated targets and exit '
                               '(succeeds even if there are outdated or missing targets)'))
+    parser.add_argument('--strict', action='store_true',
+                        help=('With --list-outdated, compare the full content '
+                              'of each target instead of its dependency stamp'))
     # If specified explicitly, this option may be a path relative to the
     # current directory when the script is invoked. The default value
     # is relative to the mbedtls root, which we don't know yet. So we
     # can't set a string as the default value here.
     parser.add_argument('--directory', metavar='DIR',
                         help='Output directory (default: tests/suites)')
+    parser.add_argument('--jobs', '-j', metavar='N', type=int, default=1,
+                        help=('Number of targets to process in parallel '
+                              '(0: number of CPUs; default: 1)'))
     parser.add_argument('targets', nargs='*', metavar='TARGET',
                         help='Target file to generate (default: all; "-": none)')
     options = parser.parse_args(args)
@@ -220,9 +670,13 @@ def main(args, description: str, generator_class: Type[TestGenerator] = TestGene
         options.directory = 'tests/suites'
     else:
         options.directory = os.path.abspath(options.directory)
+    if options.jobs <= 0:
+        options.jobs = os.cpu_count() or 1
     build_tree.chdir_to_root()
 
     generator = generator_class(options)
+    if not generator.targets:
+        raise Exception('No test data target found')
     if options.list:
         for name in sorted(generator.targets):
             print(generator.filename_for(name))
@@ -241,9 +695,4 @@ def main(args, description: str, generator_class: Type[TestGenerator] = TestGene
                            if target != '-']
     else:
         options.targets = sorted(generator.targets)
-    for target in options.targets:
-        if options.list_outdated:
-            if not generator.is_up_to_date(target):
-                print(generator.filename_for(target))
-        else:
-            generator.generate_target(target)
+    run_targets(generator, generator_class, options, options.targets)
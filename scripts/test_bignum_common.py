@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Unit test for mbedtls_framework/bignum_common.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+
+"""
+Unit tests for mbedtls_framework/bignum_common.py
+"""
+
+from typing import List
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from mbedtls_framework import bignum_common
+from mbedtls_framework import test_case
+
+
+class ShardTarget(bignum_common.OperationCommon):
+    #pylint: disable=abstract-method
+    """Test classes for the shard tests, not part of any real target."""
+    test_function = "shard_test"
+    test_name = "Shard test"
+    input_values = ["0", "1", "fe", "100", "ffffffffffffffff"]
+    input_cases = [("2", "3"), ("ff", "0")]
+
+    def result(self) -> List[str]:
+        return [self.format_result(self.int_a + self.int_b)]
+
+
+class ShardVariable(ShardTarget):
+    """A class with a single shard, where some inputs are invalid."""
+    count = 0
+    symbol = "+"
+
+    @classmethod
+    def is_valid_input(cls, values, bits_in_limb) -> bool:
+        return values[0] >= values[1]
+
+
+class ShardArchSplit(ShardTarget):
+    """A class with one shard per limb size, where validity depends on it."""
+    count = 0
+    symbol = "+"
+    input_style = "arch_split"
+    unique_combinations_only = True
+
+    @classmethod
+    def is_valid_input(cls, values, bits_in_limb) -> bool:
+        return max(values).bit_length() <= bits_in_limb
+
+
+class ShardModArchSplit(bignum_common.ModOperationCommon):
+    #pylint: disable=abstract-method
+    """A modular operation with one shard per limb size."""
+    count = 0
+    test_function = "shard_mod_test"
+    test_name = "Shard mod test"
+    symbol = "*"
+    input_style = "arch_split"
+    moduli = ["fd", "10000000000000001"]
+    input_values = ["0", "1", "fc", "ffffffff"]
+
+    def result(self) -> List[str]:
+        return [self.format_result(self.int_a * self.int_b % self.int_n)]
+
+
+class GenerateShards(TestCase):
+    """
+    Test suite for the sharded generation of OperationCommon test cases
+    """
+
+    TEST_CLASSES = [ShardVariable, ShardArchSplit, ShardModArchSplit]
+
+    @staticmethod
+    def dump(test_cases):
+        """Return a comparable representation of a list of test cases."""
+        return [(tc.description, tc.function, tc.arguments, tc.dependencies)
+                for tc in test_cases]
+
+    def check_shards(self, test_class, shards):
+        """Check that the shards reproduce generate_function_tests()."""
+        test_class.count = 5
+        expected = list(test_class.generate_function_tests())
+        expected_count = test_class.count
+        test_class.count = 5
+        # Generate the shards in reverse order, to make sure that they
+        # don't depend on each other.
+        shard_results = [test_class.generate_shard(shard, 5)
+                         for shard in reversed(shards)]
+        shard_results.reverse()
+        for cases, _size in shard_results:
+            positions = [position for position, _ in cases]
+            self.assertEqual(positions, sorted(positions))
+        merged = list(test_class.merge_shards(5, shard_results))
+        self.assertEqual(self.dump(merged), self.dump(expected))
+        self.assertEqual(test_class.count, expected_count)
+        return expected
+
+    def test_shards(self):
+        """
+        Test that merging the shards gives the unsharded output in order.
+        """
+        for test_class, shards in [(ShardVariable, [None]),
+                                   (ShardArchSplit, [32, 64]),
+                                   (ShardModArchSplit, [32, 64])]:
+            with self.subTest(test_class=test_class.__name__):
+                self.assertEqual(test_class.generation_shards(), shards)
+                expected = self.check_shards(test_class, shards)
+                # Make sure that the test is not vacuous: some inputs
+                # are invalid, and the numbering has gaps.
+                self.assertGreater(len(expected), 1)
+                self.assertLess(len(expected), test_class.count - 5)
+
+    def test_interleaved(self):
+        """
+        Test that the test cases of the shards are interleaved.
+        """
+        ShardArchSplit.count = 0
+        dependencies = [tc.dependencies[-1]
+                        for tc in ShardArchSplit.generate_function_tests()
+                        if tc.description.endswith(' + 0')]
+        self.assertEqual(dependencies[:3], ['MBEDTLS_HAVE_INT32',
+                                            'MBEDTLS_HAVE_INT64',
+                                            'MBEDTLS_HAVE_INT32'])
+
+    def test_not_shardable(self):
+        """
+        Test that classes that are not shardable have no shards.
+        """
+        class NotShardable(ShardArchSplit):
+            #pylint: disable=missing-docstring
+            shardable = False
+            @classmethod
+            def generate_function_tests(cls):
+                yield test_case.TestCase()
+        self.assertEqual(NotShardable.generation_shards(), [])
+
+
+class Prefilter(TestCase):
+    """
+    Test suite for the filtering of candidates before creating test objects
+    """
+
+    def test_only_valid_created(self):
+        """
+        Test that test objects are only created for valid systematic inputs.
+        """
+        for test_class in [ShardVariable, ShardArchSplit, ShardModArchSplit]:
+            with self.subTest(test_class=test_class.__name__):
+                created = []
+                #pylint: disable=protected-access
+                make_test_object = test_class._make_test_object
+                def make(args, bits_in_limb):
+                    #pylint: disable=cell-var-from-loop
+                    test_object = make_test_object(args, bits_in_limb)
+                    created.append(test_object)
+                    return test_object
+                test_class.count = 0
+                with patch.object(test_class, '_make_test_object', make):
+                    test_cases = list(test_class.generate_function_tests())
+                # Special cases are not prefiltered.
+                invalid = [test_object for test_object in created
+                           if not test_object.is_valid]
+                for test_object in invalid:
+                    self.assertIn((test_object.val_a, test_object.val_b),
+                                  test_class.input_cases)
+                self.assertEqual(len(created) - len(invalid), len(test_cases))
+                # The numbering accounts for the inputs that were skipped.
+                self.assertEqual(test_class.count,
+                                 len(list(test_class.candidates())) *
+                                 len(test_class.shard_limb_sizes()))
+                self.assertLess(len(created), test_class.count)
+
+
+class MergeShards(TestCase):
+    """
+    Test suite for method merge_shards()
+    """
+
+    def test_order(self):
+        """
+        Test that test cases are merged by position, and count is updated.
+        """
+        test_cases = {}
+        for position in range(8):
+            test_cases[position] = test_case.TestCase()
+            test_cases[position].set_description(str(position))
+        shard_results = [([(0, test_cases[0]), (3, test_cases[3]),
+                           (6, test_cases[6])], 9),
+                         ([(1, test_cases[1]), (7, test_cases[7])], 9),
+                         ([], 9)]
+        merged = list(ShardVariable.merge_shards(10, shard_results))
+        self.assertEqual([tc.description for tc in merged],
+                         ['0', '1', '3', '6', '7'])
+        self.assertEqual(ShardVariable.count, 19)
+
+    def test_no_shards(self):
+        """
+        Test merging no shards.
+        """
+        self.assertEqual(list(ShardVariable.merge_shards(4, [])), [])
+        self.assertEqual(ShardVariable.count, 4)
+
+
+if __name__ == '__main__':
+    unittest_main()
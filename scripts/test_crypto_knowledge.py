@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Unit test for mbedtls_framework/crypto_knowledge.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+
+"""
+Unit tests for mbedtls_framework/crypto_knowledge.py
+"""
+
+from unittest import TestCase, main as unittest_main
+
+from mbedtls_framework.crypto_knowledge import Algorithm, AlgorithmCategory
+from mbedtls_framework.crypto_knowledge import AlgorithmNotRecognized
+
+
+# Algorithm expressions as they appear in test_suite_psa_crypto_metadata.data,
+# with the expected base expression, head, category and wildcard status.
+METADATA_ALGORITHMS = [
+    ('PSA_ALG_SHA_256',
+     'PSA_ALG_SHA_256', 'SHA_256', AlgorithmCategory.HASH, False),
+    ('PSA_ALG_SHA3_512',
+     'PSA_ALG_SHA3_512', 'SHA3_512', AlgorithmCategory.HASH, False),
+    ('PSA_ALG_HMAC( PSA_ALG_SHA_256 )',
+     'PSA_ALG_HMAC(PSA_ALG_SHA_256)', 'HMAC', AlgorithmCategory.MAC, False),
+    ('PSA_ALG_CMAC',
+     'PSA_ALG_CMAC', 'CMAC', AlgorithmCategory.MAC, False),
+    ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_HMAC(PSA_ALG_SHA_256), 10)',
+     'PSA_ALG_HMAC(PSA_ALG_SHA_256)', 'HMAC', AlgorithmCategory.MAC, False),
+    ('PSA_ALG_AT_LEAST_THIS_LENGTH_MAC(PSA_ALG_CMAC, 4)',
+     'PSA_ALG_CMAC', 'CMAC', AlgorithmCategory.MAC, True),
+    ('PSA_ALG_CBC_NO_PADDING',
+     'PSA_ALG_CBC_NO_PADDING', 'CBC_NO_PADDING', AlgorithmCategory.CIPHER, False),
+    ('PSA_ALG_CCM',
+     'PSA_ALG_CCM', 'CCM', AlgorithmCategory.AEAD, False),
+    ('PSA_ALG_AEAD_WITH_SHORTENED_TAG(PSA_ALG_CCM, 7)',
+     'PSA_ALG_CCM', 'CCM', AlgorithmCategory.AEAD, False),
+    ('PSA_ALG_AEAD_WITH_AT_LEAST_THIS_LENGTH_TAG(PSA_ALG_GCM, 12)',
+     'PSA_ALG_GCM', 'GCM', AlgorithmCategory.AEAD, True),
+    ('PSA_ALG_ECDSA(PSA_ALG_ANY_HASH)',
+     'PSA_ALG_ECDSA(PSA_ALG_ANY_HASH)', 'ECDSA', AlgorithmCategory.SIGN, True),
+    ('PSA_ALG_DETERMINISTIC_ECDSA(PSA_ALG_SHA_384)',
+     'PSA_ALG_DETERMINISTIC_ECDSA(PSA_ALG_SHA_384)', 'ECDSA',
+     AlgorithmCategory.SIGN, False),
+    ('PSA_ALG_ED25519PH',
+     'PSA_ALG_ED25519PH', 'EDDSA_PREHASH', AlgorithmCategory.SIGN, False),
+    ('PSA_ALG_PURE_EDDSA',
+     'PSA_ALG_PURE_EDDSA', 'PURE_EDDSA', AlgorithmCategory.SIGN, False),
+    ('PSA_ALG_RSA_PSS_ANY_SALT(PSA_ALG_SHA_256)',
+     'PSA_ALG_RSA_PSS_ANY_SALT(PSA_ALG_SHA_256)', 'RSA_PSS_ANY_SALT',
+     AlgorithmCategory.SIGN, False),
+    ('PSA_ALG_RSA_OAEP(PSA_ALG_SHA_1)',
+     'PSA_ALG_RSA_OAEP(PSA_ALG_SHA_1)', 'RSA_OAEP',
+     AlgorithmCategory.ASYMMETRIC_ENCRYPTION, False),
+    ('PSA_ALG_HKDF(PSA_ALG_SHA_256)',
+     'PSA_ALG_HKDF(PSA_ALG_SHA_256)', 'HKDF',
+     AlgorithmCategory.KEY_DERIVATION, False),
+    ('PSA_ALG_ECDH',
+     'PSA_ALG_ECDH', 'ECDH', AlgorithmCategory.KEY_AGREEMENT, False),
+    ('PSA_ALG_KEY_AGREEMENT(PSA_ALG_ECDH, PSA_ALG_HKDF(PSA_ALG_SHA_256))',
+     'PSA_ALG_KEY_AGREEMENT(PSA_ALG_ECDH,PSA_ALG_HKDF(PSA_ALG_SHA_256))', 'ECDH',
+     AlgorithmCategory.KEY_AGREEMENT, False),
+    ('PSA_ALG_JPAKE(PSA_ALG_SHA_256)',
+     'PSA_ALG_JPAKE(PSA_ALG_SHA_256)', 'JPAKE', AlgorithmCategory.PAKE, False),
+]
+
+
+class MetadataAlgorithms(TestCase):
+    """
+    Test suite for the classification of algorithms by class Algorithm
+    """
+
+    def test_classification(self):
+        """
+        Test the base, head, category and wildcard status of algorithms.
+        """
+        for expr, base, head, category, is_wildcard in METADATA_ALGORITHMS:
+            with self.subTest(expr=expr):
+                alg = Algorithm(expr)
+                self.assertEqual(alg.expression, expr.replace(' ', ''))
+                self.assertEqual(alg.base_expression, base)
+                self.assertEqual(alg.head, head)
+                self.assertEqual(alg.category, category)
+                self.assertEqual(alg.is_wildcard, is_wildcard)
+
+    def test_expression_arguments(self):
+        """
+        Test algorithms whose arguments are C expressions other than macro calls.
+        """
+        for expr, base, head in [
+                ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_CMAC,1+2)',
+                 'PSA_ALG_CMAC', 'CMAC'),
+                ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_HMAC(PSA_ALG_SHA_256),(10))',
+                 'PSA_ALG_HMAC(PSA_ALG_SHA_256)', 'HMAC'),
+        ]:
+            with self.subTest(expr=expr):
+                alg = Algorithm(expr)
+                self.assertEqual(alg.base_expression, base)
+                self.assertEqual(alg.head, head)
+                self.assertEqual(alg.category, AlgorithmCategory.MAC)
+
+    def test_not_recognized(self):
+        """
+        Test that expressions that are not algorithms are rejected.
+        """
+        for expr in ['0', 'PSA_KEY_TYPE_AES', 'PSA_ALG_NOT_AN_ALGORITHM',
+                     'PSA_ALG_KEY_AGREEMENT', '(psa_algorithm_t)0']:
+            with self.subTest(expr=expr):
+                with self.assertRaises(AlgorithmNotRecognized):
+                    Algorithm(expr)
+
+    def test_short_expression(self):
+        """
+        Test abbreviating algorithm expressions.
+        """
+        for expr, short0, short1 in [
+                ('PSA_ALG_HMAC( PSA_ALG_SHA_256 )', 'HMAC(SHA_256)', 'HMAC(SHA_256)'),
+                ('PSA_ALG_DETERMINISTIC_ECDSA(PSA_ALG_SHA_384)',
+                 'DETERMINISTIC_ECDSA(SHA_384)', 'DET_ECDSA(SHA_384)'),
+                ('PSA_ALG_AEAD_WITH_SHORTENED_TAG(PSA_ALG_CCM, 7)',
+                 'AEAD_WITH_SHORTENED_TAG(CCM,7)', 'AEAD_SHORT(CCM,7)'),
+                ('PSA_ALG_KEY_AGREEMENT(PSA_ALG_ECDH, PSA_ALG_HKDF(PSA_ALG_SHA_256))',
+                 'KEY_AGREEMENT(ECDH,HKDF(SHA_256))', 'KA(ECDH,HKDF(SHA_256))'),
+        ]:
+            with self.subTest(expr=expr):
+                alg = Algorithm(expr)
+                self.assertEqual(alg.short_expression(), short0)
+                self.assertEqual(alg.short_expression(1), short1)
+
+    def test_key_agreement_derivation(self):
+        """
+        Test splitting combined key agreement and key derivation algorithms.
+        """
+        for expr, kdf_alg, is_valid in [
+                ('PSA_ALG_ECDH', None, False),
+                ('PSA_ALG_KEY_AGREEMENT(PSA_ALG_ECDH, PSA_ALG_HKDF(PSA_ALG_SHA_256))',
+                 'PSA_ALG_HKDF(PSA_ALG_SHA_256)', True),
+                ('PSA_ALG_KEY_AGREEMENT(PSA_ALG_FFDH, PSA_ALG_TLS12_ECJPAKE_TO_PMS)',
+                 'PSA_ALG_TLS12_ECJPAKE_TO_PMS', False),
+                ('PSA_ALG_KEY_AGREEMENT(PSA_ALG_FFDH, 0)', None, False),
+        ]:
+            with self.subTest(expr=expr):
+                alg = Algorithm(expr)
+                self.assertEqual(alg.get_key_agreement_derivation(), kdf_alg)
+                self.assertEqual(alg.is_valid_key_agreement_with_derivation(),
+                                 is_valid)
+
+    def test_invalid_truncation(self):
+        """
+        Test detecting MAC and AEAD algorithms truncated to an invalid length.
+        """
+        for expr, is_invalid in [
+                ('PSA_ALG_CMAC', False),
+                ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_HMAC(PSA_ALG_SHA_256), 10)', False),
+                ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_HMAC(PSA_ALG_SHA_256), 0x20)', False),
+                ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_HMAC(PSA_ALG_SHA_256), 33)', True),
+                ('PSA_ALG_TRUNCATED_MAC(PSA_ALG_CMAC, 3u)', True),
+                ('PSA_ALG_AT_LEAST_THIS_LENGTH_MAC(PSA_ALG_CMAC, 3)', False),
+                ('PSA_ALG_AEAD_WITH_SHORTENED_TAG(PSA_ALG_CCM, 8)', False),
+                ('PSA_ALG_AEAD_WITH_SHORTENED_TAG(PSA_ALG_CCM, 7)', True),
+        ]:
+            with self.subTest(expr=expr):
+                self.assertEqual(Algorithm(expr).is_invalid_truncation(),
+                                 is_invalid)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Unit test for mbedtls_framework/generated_files.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+
+"""
+Unit tests for mbedtls_framework/generated_files.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+
+from mbedtls_framework.generated_files import GenerationScript
+from mbedtls_framework.generated_files import run_generation_scripts
+
+
+class RunGenerationScripts(TestCase):
+    """
+    Test suite for function run_generation_scripts()
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.directory.name, 'log')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def command_for(self, generation_script):
+        """A command that logs the start and the end of the script."""
+        name = generation_script.script.stem
+        # Scripts named "slow..." give other scripts a chance to start.
+        delay = 0.2 if name.startswith('slow') else 0
+        code = ('import time\n'
+                'open({log!r}, "a").write("start {name}\\n")\n'
+                'time.sleep({delay})\n'
+                'open({log!r}, "a").write("end {name}\\n")\n'
+                'raise SystemExit({status})\n'
+                .format(log=self.log, name=name, delay=delay,
+                        status=1 if name.startswith('fail') else 0))
+        return [sys.executable, '-c', code]
+
+    def run_scripts(self, generation_scripts, jobs):
+        run_generation_scripts(generation_scripts, self.command_for, jobs)
+        with open(self.log) as input_file:
+            return input_file.read().splitlines()
+
+    @staticmethod
+    def script(name, depends_on=()):
+        return GenerationScript(Path(name + '.py'), [],
+                                depends_on=[Path(dep + '.py')
+                                            for dep in depends_on])
+
+    def test_serial(self):
+        """
+        Test that scripts run one at a time in order with jobs=1.
+        """
+        log = self.run_scripts([self.script('a'), self.script('b'),
+                                self.script('c')],
+                               jobs=1)
+        self.assertEqual(log, ['start a', 'end a',
+                               'start b', 'end b',
+                               'start c', 'end c'])
+
+    def test_dependencies(self):
+        """
+        Test that a script only starts once its dependencies have completed.
+        """
+        generation_scripts = [
+            self.script('last', ['slow1', 'slow2', 'other']),
+            self.script('slow1'),
+            self.script('slow2', ['other']),
+            self.script('other'),
+        ]
+        log = self.run_scripts(generation_scripts, jobs=4)
+        self.assertEqual(sorted(log),
+                         sorted('{} {}'.format(event, gs.script.stem)
+                                for gs in generation_scripts
+                                for event in ['start', 'end']))
+        for gs in generation_scripts:
+            start = log.index('start ' + gs.script.stem)
+            for dep in gs.depends_on:
+                self.assertLess(log.index('end ' + dep.stem), start)
+        self.assertEqual(log[-2:], ['start last', 'end last'])
+
+    def test_concurrent(self):
+        """
+        Test that independent scripts run concurrently.
+        """
+        log = self.run_scripts([self.script('slow1'), self.script('slow2')],
+                               jobs=2)
+        self.assertEqual(sorted(log[:2]), ['start slow1', 'start slow2'])
+
+    def test_dependency_not_in_run(self):
+        """
+        Test that dependencies on scripts that are not part of the run are ignored.
+        """
+        log = self.run_scripts([self.script('a', ['missing'])], jobs=2)
+        self.assertEqual(log, ['start a', 'end a'])
+
+    def test_timings(self):
+        """
+        Test that the run time of each script is returned.
+        """
+        generation_scripts = [self.script('a'), self.script('b')]
+        timings = run_generation_scripts(generation_scripts,
+                                         self.command_for, 2)
+        self.assertEqual(set(timings.keys()), {Path('a.py'), Path('b.py')})
+
+    def test_circular(self):
+        """
+        Test that circular dependencies are detected.
+        """
+        generation_scripts = [self.script('a'),
+                              self.script('b', ['c']),
+                              self.script('c', ['b'])]
+        with self.assertRaisesRegex(Exception, 'Circular dependencies') as cm:
+            run_generation_scripts(generation_scripts, self.command_for, 2)
+        self.assertIn('b.py', str(cm.exception))
+        self.assertIn('c.py', str(cm.exception))
+
+    def test_failure(self):
+        """
+        Test that a failing script raises an exception.
+        """
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_generation_scripts([self.script('fail')], self.command_for, 1)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Unit test for mbedtls_framework/persistent_cache.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+
+"""
+Unit tests for mbedtls_framework/persistent_cache.py
+"""
+
+import os
+import tempfile
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from mbedtls_framework import persistent_cache
+
+
+class PersistentCacheTestCase(TestCase):
+    """Base class for tests that use a cache in a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = patch.dict(os.environ,
+                             {persistent_cache.CACHE_DIRECTORY_ENV:
+                              self.directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def entries(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def set_age(self, name, age):
+        """Make an entry look like it was last used `age` seconds ago."""
+        path = os.path.join(self.directory.name, name)
+        mtime = os.stat(path).st_mtime - age
+        os.utime(path, (mtime, mtime))
+
+
+class LoadSave(PersistentCacheTestCase):
+    """
+    Test suite for load_json(), save_json(), load_pickle() and save_pickle()
+    """
+
+    def test_json(self):
+        """
+        Test saving and loading a JSON entry.
+        """
+        self.assertIsNone(persistent_cache.load_json('kind', 'key'))
+        persistent_cache.save_json('kind', 'key', {'a': [1, 2]})
+        self.assertEqual(persistent_cache.load_json('kind', 'key'), {'a': [1, 2]})
+        self.assertIsNone(persistent_cache.load_json('kind', 'other'))
+        self.assertIsNone(persistent_cache.load_json('other', 'key'))
+        self.assertEqual(self.entries(), ['kind-key.json'])
+
+    def test_pickle(self):
+        """
+        Test saving and loading a pickled entry.
+        """
+        persistent_cache.save_pickle('kind', 'key', {'a': frozenset([1])})
+        self.assertEqual(persistent_cache.load_pickle('kind', 'key'),
+                         {'a': frozenset([1])})
+        self.assertEqual(self.entries(), ['kind-key.pickle'])
+
+    def test_replace(self):
+        """
+        Test that saving an entry replaces the previous one.
+        """
+        persistent_cache.save_json('kind', 'key', 1)
+        persistent_cache.save_json('kind', 'key', 2)
+        self.assertEqual(persistent_cache.load_json('kind', 'key'), 2)
+        self.assertEqual(self.entries(), ['kind-key.json'])
+
+    def test_disabled(self):
+        """
+        Test that nothing is saved when the cache is disabled.
+        """
+        with patch.dict(os.environ, {persistent_cache.CACHE_DIRECTORY_ENV: ''}):
+            persistent_cache.save_json('kind', 'key', 1)
+            self.assertIsNone(persistent_cache.load_json('kind', 'key'))
+        self.assertEqual(self.entries(), [])
+
+    def test_corrupted(self):
+        """
+        Test that corrupted entries are treated as absent.
+        """
+        for name, content in [('kind-key.json', b'{"a": '),
+                              ('kind-key.pickle', b'\x80\x04'),
+                              ('kind-garbage.pickle', b'garbage')]:
+            with open(os.path.join(self.directory.name, name), 'wb') as out:
+                out.write(content)
+        self.assertIsNone(persistent_cache.load_json('kind', 'key'))
+        self.assertIsNone(persistent_cache.load_pickle('kind', 'key'))
+        self.assertIsNone(persistent_cache.load_pickle('kind', 'garbage'))
+
+    def test_unserializable(self):
+        """
+        Test that data that can't be serialized is not saved.
+        """
+        persistent_cache.save_json('kind', 'key', {1, 2})
+        persistent_cache.save_pickle('kind', 'key', lambda: None)
+        self.assertEqual(self.entries(), [])
+
+
+class Trim(PersistentCacheTestCase):
+    """
+    Test suite for function trim() and for trimming on save
+    """
+
+    def make_entries(self, kind, count):
+        """Create `count` entries of 100 bytes each, the first one being the oldest."""
+        for i in range(count):
+            persistent_cache.save_json(kind, str(i), 'x' * 98)
+            self.set_age('{}-{}.json'.format(kind, i), 100 * (count - i))
+
+    def test_trim(self):
+        """
+        Test that the least recently used entries are removed.
+        """
+        self.make_entries('kind', 5)
+        persistent_cache.trim('kind', 250)
+        self.assertEqual(self.entries(), ['kind-3.json', 'kind-4.json'])
+
+    def test_trim_other_kinds(self):
+        """
+        Test that trimming leaves other kinds of entries alone.
+        """
+        self.make_entries('kind', 3)
+        self.make_entries('kind_other', 3)
+        persistent_cache.trim('kind', 0)
+        self.assertEqual(self.entries(),
+                         ['kind_other-0.json', 'kind_other-1.json',
+                          'kind_other-2.json'])
+
+    def test_load_marks_used(self):
+        """
+        Test that loading an entry protects it from trimming.
+        """
+        self.make_entries('kind', 5)
+        persistent_cache.load_json('kind', '0')
+        persistent_cache.trim('kind', 250)
+        self.assertEqual(self.entries(), ['kind-0.json', 'kind-4.json'])
+
+    def test_save_trims(self):
+        """
+        Test that saving an entry trims the entries of its kind.
+        """
+        self.make_entries('kind', 5)
+        persistent_cache.save_json('kind', 'new', 'x' * 98, max_size=250)
+        self.assertEqual(self.entries(), ['kind-4.json', 'kind-new.json'])
+
+    def test_disabled(self):
+        """
+        Test that trimming a disabled cache does nothing.
+        """
+        self.make_entries('kind', 2)
+        with patch.dict(os.environ, {persistent_cache.CACHE_DIRECTORY_ENV: ''}):
+            persistent_cache.trim('kind', 0)
+        self.assertEqual(len(self.entries()), 2)
+
+
+if __name__ == '__main__':
+    unittest_main()
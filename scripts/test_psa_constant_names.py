@@ -12,11 +12,13 @@ or 1 (with a Python backtrace) if there was an operational error.
 
 import argparse
 from collections import namedtuple
+import concurrent.futures
 import os
 import re
 import subprocess
 import sys
-from typing import Iterable, List, Optional, Tuple
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from mbedtls_framework import build_tree
 from mbedtls_framework import c_build_helper
@@ -39,22 +41,27 @@ def gather_inputs(headers: Iterable[str],
 def run_c(type_word: str,
           expressions: Iterable[str],
           include_path: Optional[str] = None,
-          keep_c: bool = False) -> List[str]:
-    """Generate and run a program to print out numerical values of C expressions."""
+          keep_c: bool = False,
+          jobs: int = 1) -> List[str]:
+    """Generate and run a program to print out numerical values of C expressions.
+
+    Compile up to `jobs` parts of the program concurrently.
+    """
     if type_word == 'status':
         cast_to = 'long'
         printf_format = '%ld'
     else:
         cast_to = 'unsigned long'
         printf_format = '0x%08lx'
-    return c_build_helper.get_c_expression_values(
+    return c_build_helper.get_c_expression_values_via_library(
         cast_to, printf_format,
         expressions,
         caller='test_psa_constant_names.py for {} values'.format(type_word),
         file_label=type_word,
         header='#include <psa/crypto.h>',
         include_path=include_path,
-        keep_c=keep_c
+        keep_c=keep_c,
+        jobs=jobs
     )
 
 NORMALIZE_STRIP_RE = re.compile(r'\s+')
@@ -84,60 +91,149 @@ def is_simplifiable(expr: str) -> bool:
 def collect_values(inputs: InputsForTest,
                    type_word: str,
                    include_path: Optional[str] = None,
-                   keep_c: bool = False) -> Tuple[List[str], List[str]]:
+                   keep_c: bool = False,
+                   exhaustive: bool = False,
+                   jobs: int = 1) -> Tuple[List[str], List[str]]:
     """Generate expressions using known macro names and calculate their values.
 
+    If `exhaustive` is true, test every combination of arguments for
+    macros with several arguments, rather than each argument value once.
+
+    Compile up to `jobs` parts of the program that calculates the values
+    concurrently.
+
     Return a list of pairs of (expr, value) where expr is an expression and
     value is a string representation of its integer value.
     """
-    names = inputs.get_names(type_word)
-    expressions = sorted(expr
-                         for expr in inputs.generate_expressions(names)
-                         if not is_simplifiable(expr))
+    if exhaustive:
+        names = inputs.get_names(type_word)
+        sys.stderr.write('{}: {} expressions\n'.format(
+            type_word, inputs.expression_count(names, cartesian=True)))
+        expressions = sorted(expr
+                             for expr in inputs.generate_expressions(
+                                 names, cartesian=True)
+                             if not is_simplifiable(expr))
+    else:
+        expressions = [expr
+                       for expr in inputs.expressions_for(type_word)
+                       if not is_simplifiable(expr)]
     values = run_c(type_word, expressions,
-                   include_path=include_path, keep_c=keep_c)
+                   include_path=include_path, keep_c=keep_c, jobs=jobs)
     return expressions, values
 
+# Maximum total length of the values passed on one command line of the
+# program under test. psa_constant_names only takes values as command line
+# arguments, so split them to stay well below ARG_MAX (which is as small as
+# 32kB on Windows).
+MAX_COMMAND_LINE_VALUES_LENGTH = 16000
+
+def split_command_line_values(values: List[str],
+                              max_length: int = MAX_COMMAND_LINE_VALUES_LENGTH
+                              ) -> Iterator[List[str]]:
+    """Split ``values`` into batches that fit on a command line."""
+    batch = [] #type: List[str]
+    length = 0
+    for value in values:
+        if batch and length + len(value) + 1 > max_length:
+            yield batch
+            batch = []
+            length = 0
+        batch.append(value)
+        length += len(value) + 1
+    if batch:
+        yield batch
+
 class Tests:
     """An object representing tests and their results."""
 
     Error = namedtuple('Error',
                        ['type', 'expression', 'value', 'output'])
 
+    TYPE_WORDS = ['status', 'algorithm', 'ecc_curve', 'dh_group',
+                  'key_type', 'key_usage']
+
     def __init__(self, options) -> None:
         self.options = options
         self.count = 0
         self.errors = [] #type: List[Tests.Error]
+        self.timings = [] #type: List[Tuple[str, int, float]]
+        # Number of C compilations that each call to `check_one` may run
+        # concurrently.
+        self.compile_jobs = os.cpu_count() or 1
 
-    def run_one(self, inputs: InputsForTest, type_word: str) -> None:
+    def run_program(self, type_word: str, values: List[str]) -> List[str]:
+        """Run psa_constant_names on the given values of the given type.
+
+        Return the output lines, one per value.
+        """
+        outputs = [] #type: List[str]
+        for batch in split_command_line_values(values):
+            output_bytes = subprocess.check_output([self.options.program,
+                                                    type_word] + batch)
+            outputs += output_bytes.decode('ascii').strip().split('\n')
+        return outputs
+
+    def check_one(self, inputs: InputsForTest, type_word: str
+                 ) -> Tuple[int, List['Tests.Error'], str, float]:
         """Test psa_constant_names for the specified type.
 
         Run the program on the names for this type.
         Use the inputs to figure out what arguments to pass to macros that
         take arguments.
+
+        Return ``(count, errors, shown, elapsed)`` where ``shown`` is the
+        text to display with ``--show``. Don't modify ``self``, so that
+        several types can be checked concurrently.
         """
+        start = time.monotonic()
         expressions, values = collect_values(inputs, type_word,
                                              include_path=self.options.include,
-                                             keep_c=self.options.keep_c)
-        output_bytes = subprocess.check_output([self.options.program,
-                                                type_word] + values)
-        output = output_bytes.decode('ascii')
-        outputs = output.strip().split('\n')
-        self.count += len(expressions)
+                                             keep_c=self.options.keep_c,
+                                             exhaustive=self.options.exhaustive,
+                                             jobs=self.compile_jobs)
+        outputs = self.run_program(type_word, values)
+        errors = []
+        shown = []
         for expr, value, output in zip(expressions, values, outputs):
             if self.options.show:
-                sys.stdout.write('{} {}\t{}\n'.format(type_word, value, output))
+                shown.append('{} {}\t{}\n'.format(type_word, value, output))
             if normalize(expr) != normalize(output):
-                self.errors.append(self.Error(type=type_word,
-                                              expression=expr,
-                                              value=value,
-                                              output=output))
+                errors.append(self.Error(type=type_word,
+                                         expression=expr,
+                                         value=value,
+                                         output=output))
+        return len(expressions), errors, ''.join(shown), \
+            time.monotonic() - start
+
+    def record(self, type_word: str,
+               result: Tuple[int, List['Tests.Error'], str, float]) -> None:
+        """Record the result of `check_one`."""
+        count, errors, shown, elapsed = result
+        sys.stdout.write(shown)
+        self.count += count
+        self.errors += errors
+        self.timings.append((type_word, count, elapsed))
+
+    def run_one(self, inputs: InputsForTest, type_word: str) -> None:
+        """Test psa_constant_names for the specified type."""
+        self.record(type_word, self.check_one(inputs, type_word))
 
     def run_all(self, inputs: InputsForTest) -> None:
-        """Run psa_constant_names on all the gathered inputs."""
-        for type_word in ['status', 'algorithm', 'ecc_curve', 'dh_group',
-                          'key_type', 'key_usage']:
-            self.run_one(inputs, type_word)
+        """Run psa_constant_names on all the gathered inputs.
+
+        Process the types concurrently, but report them in a fixed order.
+        """
+        workers = min(self.options.jobs or len(self.TYPE_WORDS),
+                      len(self.TYPE_WORDS))
+        # Share the CPUs between the types that are processed concurrently.
+        self.compile_jobs = max((os.cpu_count() or 1) // workers, 1)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers) as executor:
+            results = executor.map(lambda type_word:
+                                   self.check_one(inputs, type_word),
+                                   self.TYPE_WORDS)
+            for type_word, result in zip(self.TYPE_WORDS, results):
+                self.record(type_word, result)
 
     def report(self, out: typing_util.Writable) -> None:
         """Describe each case where the output is not as expected.
@@ -149,6 +245,9 @@ class Tests:
             out.write('For {} "{}", got "{}" (value: {})\n'
                       .format(error.type, error.expression,
                               error.output, error.value))
+        for type_word, count, elapsed in self.timings:
+            out.write('{}: {} test cases in {:.2f}s\n'
+                      .format(type_word, count, elapsed))
         out.write('{} test cases'.format(self.count))
         if self.errors:
             out.write(', {} FAIL\n'.format(len(self.errors)))
@@ -192,6 +291,13 @@ def main():
         parser.add_argument('--program',
                             default='tf-psa-crypto/programs/psa/psa_constant_names',
                             help='Program to test')
+    parser.add_argument('--jobs', '-j', metavar='N', type=int, default=0,
+                        help='Number of types to test concurrently \
+                              (default: all)')
+    parser.add_argument('--exhaustive',
+                        action='store_true',
+                        help='Test every combination of arguments of macros \
+                              with several arguments (slow)')
     parser.add_argument('--show',
                         action='store_true',
                         help='Show tested values on stdout')
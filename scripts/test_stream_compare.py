@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Unit test for mbedtls_framework/stream_compare.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+
+"""
+Unit tests for mbedtls_framework/stream_compare.py
+"""
+
+import os
+import tempfile
+from unittest import TestCase, main as unittest_main
+
+from mbedtls_framework.stream_compare import ContentMismatch, StreamComparator
+from mbedtls_framework.stream_compare import compare_files
+
+
+class FileTestCase(TestCase):
+    """Base class for tests that use files in a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_file(self, name, content):
+        """Create a file with the given content (bytes) and return its path."""
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as out:
+            out.write(content)
+        return path
+
+
+class StreamComparatorTest(FileTestCase):
+    """
+    Test suite for class StreamComparator
+    """
+
+    def compare(self, reference, chunks, **kwargs):
+        filename = self.make_file('reference', reference)
+        with StreamComparator(filename, **kwargs) as comparator:
+            for chunk in chunks:
+                comparator.write(chunk)
+            return comparator.matches()
+
+    def test_identical(self):
+        """
+        Test that the same content in different chunks matches.
+        """
+        self.assertTrue(self.compare(b'hello\nworld\n', ['hello\n', 'world\n']))
+        self.assertTrue(self.compare(b'hello\nworld\n', ['h', 'ello\nworld', '\n']))
+        self.assertTrue(self.compare(b'', []))
+
+    def test_binary(self):
+        """
+        Test comparing in binary mode.
+        """
+        self.assertTrue(self.compare(b'\x00\xff', [b'\x00', b'\xff'], binary=True))
+        self.assertFalse(self.compare(b'\x00\xff', [b'\x00', b'\xfe'], binary=True))
+
+    def test_different(self):
+        """
+        Test that different content doesn't match.
+        """
+        self.assertFalse(self.compare(b'hello\nworld\n', ['hello\n', 'there\n']))
+
+    def test_prefix(self):
+        """
+        Test that a prefix of the file doesn't match, nor the other way round.
+        """
+        self.assertFalse(self.compare(b'hello\nworld\n', ['hello\n']))
+        self.assertFalse(self.compare(b'hello\n', ['hello\n', 'world\n']))
+        self.assertFalse(self.compare(b'hello\n', []))
+        self.assertFalse(self.compare(b'', ['hello\n']))
+
+    def test_mismatch_sticks(self):
+        """
+        Test that later matching content doesn't hide an earlier difference.
+        """
+        filename = self.make_file('reference', b'abcdef')
+        with StreamComparator(filename) as comparator:
+            comparator.write('x')
+            comparator.write('bcdef')
+            self.assertFalse(comparator.identical)
+            self.assertFalse(comparator.matches())
+
+    def test_stop_early(self):
+        """
+        Test that stop_early raises on the first difference.
+        """
+        filename = self.make_file('reference', b'abcdef')
+        with StreamComparator(filename, stop_early=True) as comparator:
+            comparator.write('abc')
+            with self.assertRaises(ContentMismatch):
+                comparator.write('xyz')
+
+    def test_close(self):
+        """
+        Test that the reference file is closed by the context manager.
+        """
+        filename = self.make_file('reference', b'abc')
+        with StreamComparator(filename) as comparator:
+            pass
+        self.assertIsNone(comparator.file)
+
+
+class CompareFiles(FileTestCase):
+    """
+    Test suite for function compare_files()
+    """
+
+    def compare(self, content1, content2, **kwargs):
+        return compare_files(self.make_file('file1', content1),
+                             self.make_file('file2', content2),
+                             **kwargs)
+
+    def test_identical(self):
+        """
+        Test that files with the same content are identical.
+        """
+        self.assertTrue(self.compare(b'', b''))
+        self.assertTrue(self.compare(b'abc\r\n', b'abc\r\n'))
+        self.assertTrue(self.compare(b'0123456789' * 10, b'0123456789' * 10,
+                                     chunk_size=7))
+
+    def test_different(self):
+        """
+        Test that files with different contents are different.
+        """
+        self.assertFalse(self.compare(b'abc', b'abd'))
+        self.assertFalse(self.compare(b'abc\n', b'abc\r\n'))
+        self.assertFalse(self.compare(b'0123456789' * 10,
+                                      b'0123456789' * 9 + b'012345678X',
+                                      chunk_size=7))
+
+    def test_prefix(self):
+        """
+        Test that a file is different from its prefixes.
+        """
+        self.assertFalse(self.compare(b'abc', b'ab'))
+        self.assertFalse(self.compare(b'ab', b'abc'))
+        self.assertFalse(self.compare(b'', b'a'))
+        self.assertFalse(self.compare(b'abcdefgh', b'abcdefg', chunk_size=4))
+
+
+if __name__ == '__main__':
+    unittest_main()
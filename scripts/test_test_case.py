@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# Unit test for mbedtls_framework/test_case.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0 OR GPL-2.0-or-later
+
+"""
+Unit tests for mbedtls_framework/test_case.py
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from unittest import TestCase, main as unittest_main
+
+from mbedtls_framework import persistent_cache
+from mbedtls_framework import test_case
+
+
+def make_test_cases(count, function='f'):
+    """Return a list of simple test cases."""
+    test_cases = []
+    for i in range(count):
+        tc = test_case.TestCase()
+        tc.set_description('Test #{}'.format(i))
+        tc.set_function(function)
+        tc.set_arguments([str(i)])
+        test_cases.append(tc)
+    return test_cases
+
+
+class RecordingStream:
+    """A writable stream that records each call to write()."""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+        return len(text)
+
+
+class ChunkedWriter(TestCase):
+    """
+    Test suite for class ChunkedWriter
+    """
+
+    def test_chunk_size(self):
+        """
+        Test that content is passed on once it reaches the chunk size.
+        """
+        out = RecordingStream()
+        writer = test_case.ChunkedWriter(out, chunk_size=5)
+        self.assertEqual(writer.write('ab'), 2)
+        writer.write('cd')
+        self.assertEqual(out.writes, [])
+        writer.write('e')
+        self.assertEqual(out.writes, ['abcde'])
+        writer.write('fghijkl')
+        self.assertEqual(out.writes, ['abcde', 'fghijkl'])
+        writer.write('m')
+        self.assertEqual(out.writes, ['abcde', 'fghijkl'])
+
+    def test_flush(self):
+        """
+        Test that flush() passes on the remaining content, and only that.
+        """
+        out = RecordingStream()
+        writer = test_case.ChunkedWriter(out, chunk_size=5)
+        writer.flush()
+        self.assertEqual(out.writes, [])
+        writer.write('ab')
+        writer.write('c')
+        writer.flush()
+        self.assertEqual(out.writes, ['abc'])
+        writer.flush()
+        self.assertEqual(out.writes, ['abc'])
+        writer.write('defgh')
+        writer.flush()
+        self.assertEqual(out.writes, ['abc', 'defgh'])
+
+    def test_hexdigest(self):
+        """
+        Test that hexdigest() flushes and hashes all the content as UTF-8.
+        """
+        out = io.StringIO()
+        writer = test_case.ChunkedWriter(out, chunk_size=4, hash_content=True)
+        for text in ['ab', 'c\n', '\u00e9\n', 'xyz']:
+            writer.write(text)
+        digest = writer.hexdigest()
+        self.assertEqual(out.getvalue(), 'abc\n\u00e9\nxyz')
+        self.assertEqual(digest,
+                         hashlib.sha256('abc\n\u00e9\nxyz'.encode('utf-8'))
+                         .hexdigest())
+
+    def test_hexdigest_matches_file_hash(self):
+        """
+        Test that hexdigest() is the hash of the file written through the writer.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.data')
+            with open(filename, 'w', encoding='utf-8') as out:
+                writer = test_case.ChunkedWriter(out, chunk_size=100,
+                                                 hash_content=True)
+                for i in range(100):
+                    writer.write('line {}\n'.format(i))
+                digest = writer.hexdigest()
+            self.assertEqual(digest, persistent_cache.file_hash(filename))
+
+    def test_write_data_stream(self):
+        """
+        Test that writing test cases in chunks gives the same content.
+        """
+        test_cases = make_test_cases(20)
+        unchunked = io.StringIO()
+        test_case.write_data_stream(unchunked, test_cases, caller='test')
+        out = RecordingStream()
+        digest = test_case.write_data_stream(out, test_cases, caller='test',
+                                             chunk_size=50, hash_content=True)
+        self.assertEqual(''.join(out.writes), unchunked.getvalue())
+        self.assertLess(len(out.writes), 20)
+        self.assertEqual(digest,
+                         hashlib.sha256(unchunked.getvalue().encode('utf-8'))
+                         .hexdigest())
+
+
+class WriteDataFile(TestCase):
+    """
+    Test suite for function write_data_file()
+    """
+
+    OLD_MTIME = 1000000000
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.data')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, test_cases, only_if_changed=True):
+        return test_case.write_data_file(self.filename, test_cases,
+                                         caller='test',
+                                         only_if_changed=only_if_changed)
+
+    def age_file(self):
+        os.utime(self.filename, (self.OLD_MTIME, self.OLD_MTIME))
+
+    def content(self):
+        with open(self.filename, encoding='utf-8') as input_file:
+            return input_file.read()
+
+    def assert_no_temporary_file(self):
+        self.assertEqual(os.listdir(self.directory.name), ['test.data'])
+
+    def test_new_file(self):
+        """
+        Test that a file is created if it doesn't exist.
+        """
+        self.write(make_test_cases(3))
+        self.assertIn('Test #2\nf:2\n', self.content())
+        self.assert_no_temporary_file()
+
+    def test_unchanged(self):
+        """
+        Test that the file is not touched if the content is unchanged.
+        """
+        self.write(make_test_cases(3))
+        self.age_file()
+        self.write(make_test_cases(3))
+        self.assertEqual(os.stat(self.filename).st_mtime, self.OLD_MTIME)
+        self.assert_no_temporary_file()
+
+    def test_unchanged_always_write(self):
+        """
+        Test that the file is rewritten without only_if_changed.
+        """
+        self.write(make_test_cases(3))
+        self.age_file()
+        self.write(make_test_cases(3), only_if_changed=False)
+        self.assertNotEqual(os.stat(self.filename).st_mtime, self.OLD_MTIME)
+        self.assert_no_temporary_file()
+
+    def check_changed(self, old_test_cases, new_test_cases):
+        self.write(old_test_cases)
+        self.age_file()
+        digest = self.write(new_test_cases)
+        self.assertNotEqual(os.stat(self.filename).st_mtime, self.OLD_MTIME)
+        self.assert_no_temporary_file()
+        other = os.path.join(self.directory.name, 'other.data')
+        test_case.write_data_file(other, new_test_cases, caller='test')
+        with open(other, encoding='utf-8') as input_file:
+            self.assertEqual(self.content(), input_file.read())
+        self.assertEqual(digest,
+                         test_case.write_data_file(other, new_test_cases,
+                                                   caller='test'))
+
+    def test_changed_middle(self):
+        """
+        Test that the file is rewritten if the content changes.
+        """
+        self.check_changed(make_test_cases(3), make_test_cases(3, 'g'))
+
+    def test_longer(self):
+        """
+        Test that the file is rewritten if the old content is a prefix.
+        """
+        self.check_changed(make_test_cases(3), make_test_cases(4))
+
+    def test_shorter(self):
+        """
+        Test that the file is rewritten if the new content is a prefix.
+        """
+        self.check_changed(make_test_cases(4), make_test_cases(3))
+
+    def test_large_changed_at_end(self):
+        """
+        Test that the matching prefix is copied when it spans several chunks.
+        """
+        count = test_case.DATA_CHUNK_SIZE // 10
+        old_test_cases = make_test_cases(count)
+        new_test_cases = make_test_cases(count)
+        new_test_cases[-1].set_function('g')
+        self.check_changed(old_test_cases, new_test_cases)
+
+    def test_error(self):
+        """
+        Test that the file is left alone if generation fails.
+        """
+        self.write(make_test_cases(3))
+        self.age_file()
+        def failing_test_cases():
+            yield from make_test_cases(3, 'g')
+            raise ValueError
+        with self.assertRaises(ValueError):
+            self.write(failing_test_cases())
+        self.assertEqual(os.stat(self.filename).st_mtime, self.OLD_MTIME)
+        self.assertIn('Test #2\nf:2\n', self.content())
+        self.assert_no_temporary_file()
+
+
+if __name__ == '__main__':
+    unittest_main()